@@ -1,15 +1,22 @@
 #
 # Define auxiliary functions to run the scripts
 #
+# The heavy dependencies (pybamm, pandas, matplotlib) are imported inside the
+# functions that need them, so that the naming helpers (e.g. create_filename or
+# create_C_tag) can be imported quickly. Run benchmark_import.py to check the import
+# time after changing this file.
+#
 
-import pybamm
-import pandas as pd
-import matplotlib.pyplot as plt
 import gc
-import scienceplots
+import hashlib
+import json
+import pickle
 
 
 def set_plotting_format(mode="presentation"):
+    import matplotlib.pyplot as plt
+    import scienceplots  # noqa: F401 (registers the styles)
+
     plt.style.use(["science", "vibrant"])
 
     mode = "paper"
@@ -36,7 +43,95 @@ def set_plotting_format(mode="presentation"):
         )
 
 
-def create_filename(model, C_dch, C_ch):
+def downsample_lttb(x, y, N):
+    """
+    Downsamples a curve to N points with the largest-triangle-three-buckets algorithm,
+    which keeps the peaks and the shape of the curve. The points between the first and
+    the last are split into N - 2 buckets and, in each bucket, the point forming the
+    largest triangle with the previous bucket and the average of the next bucket is
+    kept. The previous bucket is represented by its average rather than by its
+    selected point, so all the buckets are processed at once. Curves with N points or
+    fewer are returned unchanged.
+
+    Buckets are never empty, but a bucket without a valid triangle is dropped, so
+    fewer than N points can be returned. This is the case of a bucket with only NaN
+    values and, as the NaN values spread through the averages, of its neighbours.
+    """
+    import numpy as np
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if N >= n or N < 3:
+        return x, y
+
+    # Bucket of each of the points between the first and the last
+    edges = np.linspace(1, n - 1, N - 1).astype(int)
+    counts = np.diff(edges)
+    bucket = np.repeat(np.arange(N - 2), counts)
+
+    # Averages of the previous and next buckets, with the end points as the buckets
+    # before the first and after the last
+    x_mean = np.add.reduceat(x[1:-1], edges[:-1] - 1) / counts
+    y_mean = np.add.reduceat(y[1:-1], edges[:-1] - 1) / counts
+    x_prev = np.concatenate([x[:1], x_mean[:-1]])[bucket]
+    y_prev = np.concatenate([y[:1], y_mean[:-1]])[bucket]
+    x_next = np.concatenate([x_mean[1:], x[-1:]])[bucket]
+    y_next = np.concatenate([y_mean[1:], y[-1:]])[bucket]
+
+    area = np.abs(
+        (x_prev - x_next) * (y[1:-1] - y_prev) - (x_prev - x[1:-1]) * (y_next - y_prev)
+    )
+    # First point with the largest area of each bucket
+    largest = np.flatnonzero(area == np.maximum.reduceat(area, edges[:-1] - 1)[bucket])
+    first = np.concatenate([[True], np.diff(bucket[largest]) > 0])
+    index = np.concatenate([[0], largest[first] + 1, [n - 1]])
+
+    return x[index], y[index]
+
+
+def plot_downsampled(ax, x, y, dpi=300, points_per_pixel=2, **kwargs):
+    """
+    Plots a curve downsampled to a budget of points per pixel of the width of the axes
+    at the given resolution, so it looks the same but is faster to draw.
+    """
+    width = ax.get_position().width * ax.figure.get_figwidth() * dpi
+    x, y = downsample_lttb(x, y, int(points_per_pixel * width))
+    return ax.plot(x, y, **kwargs)
+
+
+def rasterize_dense_axes(fig, N_points=20000):
+    """
+    Rasterises the curves of the axes with more than N_points points in total, so
+    vector figures (e.g. pdf) with many points stay small. Many short curves and a few
+    long ones (e.g. not downsampled with :func:`plot_downsampled`) are treated
+    alike. It has no effect on raster formats.
+    """
+    for ax in fig.axes:
+        if sum(len(line.get_xdata()) for line in ax.lines) > N_points:
+            for line in ax.lines:
+                line.set_rasterized(True)
+
+
+def create_mesh_tag(mesh):
+    """
+    Returns the tag of a mesh, given as a dictionary of arguments of
+    :func:`create_mesh`, e.g. "uniform10x10" for {"Nx": 10, "Nr": 10} or
+    "graded10x10-stretchx1" for {"Nx": 10, "Nr": 10, "grading": "graded",
+    "stretch_x": 1}. PyBaMM's default mesh (None) has no tag.
+    """
+    if mesh is None:
+        return ""
+    mesh = dict(mesh)
+    tag = "{}{}x{}".format(
+        mesh.pop("grading", "uniform"), mesh.pop("Nx", 20), mesh.pop("Nr", 20)
+    )
+    for key, value in sorted(mesh.items()):
+        tag += "-{}{:g}".format(key.replace("_", ""), value)
+    return tag
+
+
+def create_filename(model, C_dch, C_ch, mesh=None):
     model_name, tag = create_model_tag(model)
 
     if isinstance(C_dch, str):
@@ -46,19 +141,29 @@ def create_filename(model, C_dch, C_ch):
 
     filename = model_name + "_" + dch_tag + "_" + create_C_tag(C_ch)
     filename = filename.replace("+", "_") + tag
+    if mesh is not None:
+        filename += "_" + create_mesh_tag(mesh)
     return filename
 
 
-def run_cycle(simulation, cycle_number, experiment=None):
+def run_cycle(simulation, cycle_number, experiment=None, model=None):
+    """
+    Solves a cycle of a simulation starting from its stored first state. If a model is
+    given (e.g. DFN+SR for a SPMe+SR simulation), the cycle is solved with that model
+    instead, mapping the state of the simulation onto it by variable name.
+    """
+    import pybamm
+
     # set initial conditions
-    model = simulation.model
+    if model is None:
+        model = simulation.model
     model.set_initial_conditions_from(
         simulation.solution.all_first_states[cycle_number]
     )
 
     if experiment is None:
         experiment = pybamm.Experiment(
-            simulation.experiment.operating_conditions_cycles[cycle_number]
+            get_cycle_operating_conditions(simulation.experiment, cycle_number)
         )
 
     # solve cycle
@@ -74,6 +179,311 @@ def run_cycle(simulation, cycle_number, experiment=None):
     return sim
 
 
+def starting_state(state):
+    """Turns a stored first state into a solution the experiment can start from."""
+    state = state.copy()
+    # The solver only steps on from solutions that reached their final time
+    state.termination = "final time"
+    state.cycles = []
+    state.all_summary_variables = []
+    state.all_first_states = []
+    return state
+
+
+def run_cycles(simulation, cycle_numbers, experiment=None, model=None):
+    """
+    Batched version of :func:`run_cycle`: solves several cycles of a simulation, each
+    starting from its stored first state. The experiment can be None (the stored
+    cycles), an Experiment used for all cycles or a list with one Experiment per cycle.
+    Cycles sharing the same experiment are solved with one Simulation, so the model
+    is built and discretised once rather than once per cycle. If that experiment has
+    a single step (e.g. the discharge of the cycles), the cycles are integrated
+    together as one stacked system, each stopping at its own termination event (see
+    :func:`stacked_solve.solve_stacked`); otherwise, or if the stacked solve fails,
+    they are solved one after the other.
+
+    Returns a list with the solution of each cycle.
+    """
+    import pybamm
+    from stacked_solve import solve_stacked
+
+    if model is None:
+        model = simulation.model
+
+    sims = {}
+    groups = {}
+    for i, cycle_number in enumerate(cycle_numbers):
+        if experiment is None:
+            cycle_experiment = pybamm.Experiment(
+                get_cycle_operating_conditions(simulation.experiment, cycle_number)
+            )
+        elif isinstance(experiment, list):
+            cycle_experiment = experiment[i]
+        else:
+            cycle_experiment = experiment
+
+        key = repr(cycle_experiment.args)
+        if key not in sims:
+            sims[key] = pybamm.Simulation(
+                model,
+                experiment=cycle_experiment,
+                parameter_values=simulation.parameter_values,
+                var_pts=simulation.var_pts,
+            )
+            groups[key] = []
+        groups[key].append(i)
+
+    solutions = [None] * len(cycle_numbers)
+    for key, indices in groups.items():
+        sim = sims[key]
+        states = [
+            starting_state(simulation.solution.all_first_states[cycle_numbers[i]])
+            for i in indices
+        ]
+        if len(sim.experiment.operating_conditions) == 1:
+            try:
+                for i, solution in zip(indices, solve_stacked(sim, states)):
+                    solutions[i] = solution
+                continue
+            except pybamm.SolverError as error:
+                print("Stacked solve failed ({}), solving cycles in turn".format(error))
+
+        for i, state in zip(indices, states):
+            solutions[i] = sim.solve(starting_solution=state).cycles[-1]
+
+    return solutions
+
+
+def solve_cycles(
+    simulation,
+    N_cycles,
+    save_at_cycles=None,
+    callbacks=None,
+    on_cycle_end=None,
+    cycle_variables=None,
+    RPT_simulation=None,
+    RPT_every=None,
+    on_RPT_end=None,
+    **kwargs
+):
+    """
+    Solves a simulation whose experiment defines one period of cycles (e.g. a single
+    CCCV cycle) by repeating the period until N_cycles have been solved, each period
+    starting from the last state of the previous one. The result is the same as
+    solving the experiment repeated N_cycles times, but the experiment is parsed and
+    the model built only once. After each cycle, on_cycle_end(cycle_number,
+    first_state) is called (zero-indexed), e.g. to publish the states while cycling.
+
+    save_at_cycles can be a :class:`retention.RetentionPolicy`, which writes the
+    cycles it keeps to disk as they are completed.
+
+    cycle_variables is a dictionary of functions of the solution of a cycle, e.g.
+    the maximum of a variable over the cycle (see cycle_summary.CYCLE_VARIABLES).
+    They are evaluated on each cycle before it is discarded and added to its
+    summary variables, which are otherwise evaluated at the end of the cycle.
+    Similarly, the callbacks with an on_cycle_solution(cycle_number, cycle) method
+    (e.g. cycle_summary.DischargeCurveWriter) are given the solution of each cycle.
+
+    If RPT_simulation is given, its experiment (e.g. a slow discharge followed by a
+    recharge) is run after every RPT_every cycles, which must be a multiple of the
+    period, and the cycling continues from its last state. After each RPT,
+    on_RPT_end(cycle_number, RPT_solution) is called.
+
+    The solution (with the saved cycles, summary variables and first states of all
+    cycles) is stored in the simulation, as for `simulation.solve`. Other keyword
+    arguments (e.g. inputs or calc_esoh) are passed to `simulation.solve`.
+    """
+    import pybamm
+
+    period = len(simulation.experiment.cycle_lengths)
+    if RPT_simulation is not None and RPT_every % period != 0:
+        raise ValueError(
+            "RPT_every ({}) must be a multiple of the number of cycles in the "
+            "experiment ({})".format(RPT_every, period)
+        )
+    # A retention policy (see retention.py) can be given instead of the cycles to save
+    retention = save_at_cycles if hasattr(save_at_cycles, "retain") else None
+    if retention is not None:
+        retention.start(simulation, N_cycles)
+    cycles = []
+    all_summary_variables = []
+    all_first_states = []
+    solution = None
+    state = None
+
+    while len(all_first_states) < N_cycles:
+        # Save all the cycles of the period, then keep only the requested ones
+        if state is None:
+            period_solution = simulation.solve(
+                save_at_cycles=None, callbacks=callbacks, **kwargs
+            )
+        else:
+            try:
+                period_solution = simulation.solve(
+                    starting_solution=starting_state(state),
+                    save_at_cycles=None,
+                    callbacks=callbacks,
+                    **kwargs
+                )
+            except pybamm.SolverError:
+                # Each period starts as the first cycle of the experiment, so PyBaMM
+                # raises if its first step fails. Stop and keep the cycles solved so
+                # far, as PyBaMM does for a failure after the first cycle
+                break
+
+        for cycle, summary_variables, first_state in zip(
+            period_solution.cycles,
+            period_solution.all_summary_variables,
+            period_solution.all_first_states,
+        ):
+            cycle_number = len(all_first_states) + 1
+            if cycle_number > N_cycles:
+                break
+            for name, function in (cycle_variables or {}).items():
+                summary_variables[name] = function(cycle)
+            for callback in callbacks or []:
+                if hasattr(callback, "on_cycle_solution"):
+                    callback.on_cycle_solution(cycle_number, cycle)
+            if retention is not None:
+                # The policy writes the cycles it keeps to disk
+                retention.retain(cycle_number, cycle, summary_variables)
+            save_this_cycle = (
+                # always save cycle 1
+                cycle_number == 1
+                # retention policy: only cycle 1 is kept in memory
+                or (retention is None and save_at_cycles is None)
+                # list: save all cycles in the list
+                or (isinstance(save_at_cycles, list) and cycle_number in save_at_cycles)
+                # int: save all multiples
+                or (
+                    isinstance(save_at_cycles, int)
+                    and cycle_number % save_at_cycles == 0
+                )
+            )
+            if save_this_cycle:
+                solution = cycle if solution is None else solution + cycle
+                cycles.append(cycle)
+            else:
+                cycles.append(None)
+            all_summary_variables.append(summary_variables)
+            all_first_states.append(first_state)
+            if on_cycle_end is not None:
+                on_cycle_end(cycle_number - 1, first_state)
+
+        # Stop if the experiment became infeasible
+        if not is_feasible(period_solution, period):
+            break
+        state = period_solution.cycles[-1].last_state
+
+        N_solved = len(all_first_states)
+        if RPT_simulation is not None and N_solved % RPT_every == 0:
+            try:
+                RPT_solution = RPT_simulation.solve(
+                    starting_solution=starting_state(state), **kwargs
+                )
+            except pybamm.SolverError:
+                break
+            if on_RPT_end is not None:
+                on_RPT_end(N_solved - 1, RPT_solution)
+            if not is_feasible(
+                RPT_solution, len(RPT_simulation.experiment.cycle_lengths)
+            ):
+                break
+            state = RPT_solution.cycles[-1].last_state
+
+    solution.cycles = cycles
+    solution.set_summary_variables(all_summary_variables)
+    solution.all_first_states = all_first_states
+    simulation._solution = solution
+
+    return solution
+
+
+def is_feasible(solution, N_cycles):
+    """Whether all the N_cycles of an experiment were completed."""
+    termination = solution.cycles[-1].termination
+    return len(solution.cycles) == N_cycles and (
+        termination == "final time" or "[experiment]" in termination
+    )
+
+
+def cycling_experiment(C_dch, C_ch):
+    """
+    One cycle of the CCCV protocol of the article. It is parsed once and repeated
+    with :func:`solve_cycles`, rather than repeating the steps in the experiment.
+    """
+    import pybamm
+
+    return pybamm.Experiment(
+        [
+            (
+                "Discharge at {}C until 2.5 V".format(C_dch),
+                "Charge at {}C until 4.2 V".format(C_ch),
+                "Hold at 4.2 V until C/20",
+            )
+        ]
+    )
+
+
+def get_cycle_operating_conditions(experiment, cycle_number):
+    """
+    Returns the operating conditions of a cycle. Experiments solved with
+    :func:`solve_cycles` only define one period of cycles, which is repeated.
+    """
+    cycles = experiment.operating_conditions_cycles
+    return cycles[cycle_number % len(cycles)]
+
+
+def get_state_variables(model, state):
+    """
+    Returns the values of the state variables of a model in a solution, as a
+    dictionary that can be passed to `model.set_initial_conditions_from`. This is much
+    smaller than the solution, so it can be cheaply sent to other processes or stored.
+    """
+    import pybamm
+
+    names = []
+    for var in model.initial_conditions:
+        if isinstance(var, pybamm.Concatenation):
+            names += [child.name for child in var.orphans]
+        else:
+            names.append(var.name)
+
+    return {name: state[name].data for name in names}
+
+
+def get_profiles_at_cycles(solution, variable, spatial_variable, cycles=None):
+    """
+    Evaluates a spatially-distributed variable at the first state of the given cycles
+    (all the stored cycles by default). The states are stacked into a single solution
+    so the variable is evaluated in one go, rather than once per cycle. Note that the
+    inputs of the first state are used for all cycles.
+
+    Returns the spatial coordinate and an array of values with one row per cycle.
+    """
+    import numpy as np
+    import pybamm
+
+    states = solution.all_first_states
+    if cycles is None:
+        cycles = range(len(states))
+    # The stacked times must be increasing, so evaluate each cycle once and in order
+    unique_cycles, index = np.unique(cycles, return_inverse=True)
+    states = [states[i] for i in unique_cycles]
+
+    stacked_states = pybamm.Solution(
+        np.concatenate([state.t for state in states]),
+        np.hstack([np.array(state.y) for state in states]),
+        states[0].all_models[0],
+        states[0].all_inputs[0],
+    )
+
+    x = states[0][spatial_variable].entries[:, 0]
+    values = stacked_states[variable].entries.T[index]
+
+    return x, values
+
+
 def create_C_tag(C_rate, bar=False):
     if float(C_rate).is_integer():
         C_tag = "{:.0f}C".format(C_rate)
@@ -88,10 +498,29 @@ def create_C_tag(C_rate, bar=False):
     return C_tag
 
 
+def parse_C_tag(C_tag):
+    """Inverse of :func:`create_C_tag`, returns the C-rate as a float."""
+    C_tag = C_tag.replace("/", "")
+    if C_tag[0] == "C":
+        return 1 / float(C_tag[1:])
+    else:
+        return float(C_tag[:-1])
+
+
 def create_model_tag(model):
     tag = ""
 
-    if isinstance(model, pybamm.BaseModel):
+    if isinstance(model, dict):
+        model_name = model["name"]
+        if model["SEI"]:
+            tag += "_SEI"
+        if model["plating"]:
+            tag += "_plating"
+        if model["porosity"]:
+            tag += "_porosity"
+    else:
+        import pybamm
+
         model_name = model.name
         if not isinstance(model.submodels["primary sei"], pybamm.sei.NoSEI):
             tag += "_SEI"
@@ -101,18 +530,54 @@ def create_model_tag(model):
             tag += "_plating"
         if not isinstance(model.submodels["porosity"], pybamm.porosity.Constant):
             tag += "_porosity"
-    else:
-        model_name = model["name"]
-        if model["SEI"]:
-            tag += "_SEI"
-        if model["plating"]:
-            tag += "_plating"
-        if model["porosity"]:
-            tag += "_porosity"
 
     return model_name, tag
 
 
+def create_model_options(options):
+    """
+    Returns the PyBaMM options for the degradation options used in the filenames, e.g.
+    {"SEI": True, "plating": False, "porosity": True}.
+    """
+    return {
+        "SEI": "ec reaction limited" if options["SEI"] else "none",
+        "SEI porosity change": "true" if options["porosity"] else "false",
+        "lithium plating": "irreversible" if options["plating"] else "none",
+        "lithium plating porosity change": "true" if options["porosity"] else "false",
+    }
+
+
+def create_mesh(model, Nx=20, Nr=20, grading="uniform", **kwargs):
+    """
+    Returns the mesh settings of a simulation (var_pts and submesh_types), to be
+    passed to `pybamm.Simulation`, with Nx points in each part of the cell and Nr in
+    each particle. The grading is "uniform" (as PyBaMM's default mesh) or "graded",
+    finer near the particle surfaces and the separator (see graded_mesh.py, which
+    the other keyword arguments are passed to).
+    """
+    import pybamm
+
+    var = pybamm.standard_spatial_vars
+    mesh = {
+        "var_pts": {
+            var.x_n: Nx,
+            var.x_s: Nx,
+            var.x_p: Nx,
+            var.r_n: Nr,
+            var.r_p: Nr,
+        }
+    }
+    if grading == "graded":
+        from graded_mesh import graded_submesh_types
+
+        mesh["submesh_types"] = graded_submesh_types(model, **kwargs)
+    elif grading != "uniform":
+        raise ValueError(
+            "grading must be 'uniform' or 'graded', not '{}'".format(grading)
+        )
+    return mesh
+
+
 def assemble_model(options):
     raise NotImplementedError(
         "The assemble_model has been deprecated,"
@@ -142,6 +607,7 @@ def stripping_exchange_current_density_OKane2020(c_e, c_Li, T):
     :class:`pybamm.Symbol`
         Exchange-current density [A.m-2]
     """
+    import pybamm
 
     k_plating = pybamm.Parameter("Lithium plating kinetic rate constant [m.s-1]")
 
@@ -170,13 +636,44 @@ def plating_exchange_current_density_OKane2020(c_e, c_Li, T):
     :class:`pybamm.Symbol`
         Exchange-current density [A.m-2]
     """
+    import pybamm
 
     k_plating = pybamm.Parameter("Lithium plating kinetic rate constant [m.s-1]")
 
     return pybamm.constants.F * k_plating * c_e
 
 
+def parameter_fingerprint(param):
+    """
+    Returns a hash of the parameter values, so simulations run with the same
+    parameters can be identified without loading them.
+    """
+    fingerprint = hashlib.sha1()
+    for key, value in sorted(param.items()):
+        if callable(value):
+            value = value.__module__ + "." + value.__name__
+        elif isinstance(value, tuple):
+            # Parameters provided as data
+            name, data = value
+            value = name + hashlib.sha1(pickle.dumps(data)).hexdigest()
+        fingerprint.update("{}={!r};".format(key, value).encode())
+
+    return fingerprint.hexdigest()
+
+
+def write_metadata(filename, **metadata):
+    """Writes the metadata of an output file to a json file next to it."""
+    if "var_pts" in metadata:
+        metadata["var_pts"] = {
+            getattr(var, "name", var): npts for var, npts in metadata["var_pts"].items()
+        }
+    with open(filename + ".json", "w") as f:
+        json.dump(metadata, f, indent=4)
+
+
 def set_parameters(ref="Chen2020"):
+    import pybamm
+
     param = pybamm.ParameterValues(ref)
 
     param.update(
@@ -207,13 +704,191 @@ def set_parameters(ref="Chen2020"):
     return param
 
 
-def run_RPT(simulation, C_rate=1 / 3, RPT_at_cycles=None):
-    """Runs RPT for a given simulation and C_rate."""
+def run_cycling(
+    model,
+    param,
+    C_dch,
+    C_ch,
+    N_cycles,
+    save_at_cycles=None,
+    options=None,
+    archive_options=None,
+    mesh=None,
+    on_cycle_end=None,
+):
+    """
+    Cycles a model with the CCCV protocol of the article, writing the summary
+    variables of each cycle as it is completed, and saves the simulation and its
+    metadata in data/. Returns the filename of the saved simulation.
+
+    If archive_options is given, the first states of the cycles are saved compressed,
+    as a :class:`state_archive.StateArchive` with those options. save_at_cycles can be
+    a :class:`retention.RetentionPolicy`, whose cycles are written to data/ by default.
+    mesh is a dictionary of arguments of :func:`create_mesh`, e.g.
+    {"Nx": 10, "Nr": 10}, or None for PyBaMM's default mesh.
+    on_cycle_end is passed to :func:`solve_cycles`.
+    """
+    import os
+    import pybamm
+    from cycle_summary import (
+        CycleSummaryWriter,
+        DischargeCurveWriter,
+        ProfileWriter,
+        CYCLE_VARIABLES,
+    )
+
+    if save_at_cycles is None:
+        save_at_cycles = [1]  # [1] by default to save memory
+
+    sim = pybamm.Simulation(
+        model,
+        parameter_values=param,
+        experiment=cycling_experiment(C_dch, C_ch),
+        solver=pybamm.CasadiSolver("safe"),
+        **({} if mesh is None else create_mesh(model, **mesh))
+    )
+    filename = create_filename(model, C_dch, C_ch, mesh=mesh)
+    retention = save_at_cycles if hasattr(save_at_cycles, "retain") else None
+    if retention is not None and retention.directory is None:
+        retention.directory = os.path.join(
+            "data", "cycles_" + filename + "_{}".format(N_cycles)
+        )
+    # Write the summary variables, the discharge curve and the porosity profile of
+    # each cycle as soon as it is completed
+    summary_writer = CycleSummaryWriter(
+        os.path.join("data", "summary_" + filename + "_{}.csv".format(N_cycles))
+    )
+    curve_writer = DischargeCurveWriter(
+        os.path.join("data", "voltage_" + filename + "_{}.csv".format(N_cycles))
+    )
+    profile_writer = ProfileWriter(
+        os.path.join("data", "porosity_" + filename + "_{}.csv".format(N_cycles))
+    )
+    solve_cycles(
+        sim,
+        N_cycles,
+        save_at_cycles=save_at_cycles,
+        callbacks=[summary_writer, curve_writer, profile_writer],
+        on_cycle_end=on_cycle_end,
+        cycle_variables=CYCLE_VARIABLES,
+    )
+    if archive_options is not None:
+        from state_archive import compress_states
+
+        compress_states(sim.solution, **archive_options)
+    # Hack to allow pickling
+    # sim.op_conds_to_built_solvers = None
+    sim_filename = os.path.join("data", "sim_" + filename + "_{}.pkl".format(N_cycles))
+    # Save to a temporary name and move it into place once the metadata is written,
+    # so an existing simulation file is always complete
+    sim.save(sim_filename + ".part")
+    retention_metadata = {}
+    if retention is not None:
+        retention_metadata = {
+            "retained_cycles": retention.retained_cycles,
+            "retained_directory": retention.directory,
+        }
+    write_metadata(
+        sim_filename,
+        model=model.name,
+        options=options,
+        C_dch=C_dch,
+        C_ch=C_ch,
+        N_cycles=N_cycles,
+        var_pts=sim.var_pts,
+        grading=(mesh or {}).get("grading", "uniform"),
+        parameters=parameter_fingerprint(param),
+        **retention_metadata
+    )
+    os.replace(sim_filename + ".part", sim_filename)
+
+    return sim_filename
+
+
+def RPT_experiment(C_rate=1 / 3, C_ch=None):
+    """
+    Experiment of the RPT at a given C-rate. If C_ch is given, the RPT is followed by
+    the CCCV charge of the cycling, so the cycling can continue after it (see the RPT
+    insertions of :func:`solve_cycles`).
+    """
+    import pybamm
+
+    steps = ["Discharge at {}C until 2.5V".format(C_rate)]
+    if C_ch is not None:
+        steps += ["Charge at {}C until 4.2 V".format(C_ch), "Hold at 4.2 V until C/20"]
+
+    return pybamm.Experiment([tuple(steps)])
+
+
+def solve_RPT(
+    model,
+    state,
+    experiment,
+    parameter_values,
+    solver=None,
+    var_pts=None,
+    lean=False,
+    submesh_types=None,
+):
+    """
+    Runs a RPT starting from a state, given either as a Solution or as a dictionary
+    of the state variables (see :func:`get_state_variables`). If lean is True the eSOH
+    summary variables are skipped, as only the discharge capacity is needed. The mesh
+    (var_pts and submesh_types) must be the one of the state.
+
+    Returns the discharge capacity and the termination reason.
+    """
+    import pybamm
+
+    # set initial conditions
+    model.set_initial_conditions_from(state)
+
+    # solve cycle
+    sim = pybamm.Simulation(
+        model,
+        experiment=experiment,
+        parameter_values=parameter_values,
+        solver=solver,
+        var_pts=var_pts,
+        submesh_types=submesh_types,
+    )
+    if lean:
+        sim.solve(calc_esoh=False)
+        Q = [
+            sim.solution.first_state["Discharge capacity [A.h]"].entries[0],
+            sim.solution.last_state["Discharge capacity [A.h]"].entries[-1],
+        ]
+    else:
+        sim.solve()
+        Q = sim.solution["Discharge capacity [A.h]"].entries
+
+    return Q[-1] - Q[0], sim.solution.termination
+
 
-    experiment = pybamm.Experiment(["Discharge at {}C until 2.5V".format(C_rate)])
+def run_RPT(
+    simulation,
+    C_rate=1 / 3,
+    RPT_at_cycles=None,
+    lean=False,
+    filename=None,
+    resume=False,
+):
+    """
+    Runs RPT for a given simulation and C_rate. If lean is True, the eSOH summary
+    variables are skipped, as only the discharge capacity and the termination reason
+    are needed.
+
+    If a filename is given, each RPT is appended to that csv file as soon as it is
+    completed. If resume is True, the RPTs already in the file are kept and only the
+    missing ones are run, so an interrupted run can be continued.
+    """
+    import os
+    import csv
+    import pandas as pd
+
+    experiment = RPT_experiment(C_rate)
+    columns = ["Cycle number", "Discharge capacity [A.h]", "Termination"]
 
-    capacity = []
-    termination = []
     N = len(simulation.solution.all_first_states)
 
     if RPT_at_cycles is None:
@@ -224,40 +899,56 @@ def run_RPT(simulation, C_rate=1 / 3, RPT_at_cycles=None):
     else:
         cycle_list = RPT_at_cycles
 
+    df = pd.DataFrame(columns=columns)
+    if resume and filename is not None and os.path.exists(filename):
+        # Drop incomplete rows (e.g. if the run was killed while writing). An empty
+        # file, or one with just the header, means that no RPT was completed
+        try:
+            df = pd.read_csv(filename, index_col=0).dropna()
+        except pd.errors.EmptyDataError:
+            pass
+        if len(df) == 0:
+            df = pd.DataFrame(columns=columns)
+        print("Resuming from {} RPTs in {}".format(len(df), filename))
+    done = set(df["Cycle number"])
+
+    if filename is not None:
+        df.to_csv(filename)
+        f = open(filename, "a", newline="")
+        writer = csv.writer(f)
+
+    data = []
     for i in cycle_list:
+        if i + 1 in done:
+            continue
+
         # print output
         print("Running RPT for cycle {} of {}".format(i + 1, N))
 
-        # set initial conditions
-        model = simulation.model
-        model.set_initial_conditions_from(simulation.solution.all_first_states[i])
-
-        # solve cycle
-        if experiment is not None:
-            sim = pybamm.Simulation(
-                model,
-                experiment=experiment,
-                parameter_values=simulation.parameter_values,
-                solver=simulation.solver,
-                var_pts=simulation.var_pts,
-            )
-        sim.solve()
-        capacity.append(
-            sim.solution["Discharge capacity [A.h]"].entries[-1]
-            - sim.solution["Discharge capacity [A.h]"].entries[0]
+        Q, reason = solve_RPT(
+            simulation.model,
+            simulation.solution.all_first_states[i],
+            experiment,
+            simulation.parameter_values,
+            solver=simulation.solver,
+            var_pts=simulation.var_pts,
+            lean=lean,
+            submesh_types=simulation.submesh_types,
         )
-        termination.append(sim.solution.termination)
+        data.append([i + 1, Q, reason])
+        if filename is not None:
+            writer.writerow([len(df) + len(data) - 1] + data[-1])
+            f.flush()
 
-        del model
-        del sim
         gc.collect()
 
-    df = pd.DataFrame(
-        data={
-            "Cycle number": [x + 1 for x in cycle_list],
-            "Discharge capacity [A.h]": capacity,
-            "Termination": termination,
-        }
-    )
+    if len(data) > 0:
+        df = pd.concat([df, pd.DataFrame(data, columns=columns)], ignore_index=True)
+    df = df[df["Cycle number"].isin([x + 1 for x in cycle_list])]
+    df = df.sort_values("Cycle number", ignore_index=True)
+
+    if filename is not None:
+        f.close()
+        df.to_csv(filename)
 
     return df
@@ -0,0 +1,44 @@
+#
+# Check the import time of the lightweight helpers
+#
+
+import sys
+import statistics
+import subprocess
+
+# Change settings here
+modules = ["auxiliary_functions", "catalog"]
+heavy_modules = ["pybamm", "pandas", "matplotlib", "scienceplots", "casadi"]
+N_runs = 10  # number of fresh interpreters to time the import
+budget = 0.2  # maximum median import time in seconds
+
+# Time the import in a fresh interpreter, and check that it does not pull in any of
+# the heavy dependencies
+code = (
+    "import sys, time\n"
+    "t = time.perf_counter()\n"
+    "import {modules}\n"
+    "t = time.perf_counter() - t\n"
+    "loaded = [m for m in {heavy_modules} if m in sys.modules]\n"
+    "print(t, ','.join(loaded))\n"
+).format(modules=", ".join(modules), heavy_modules=heavy_modules)
+
+times = []
+for _ in range(N_runs):
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout.split()
+    times.append(float(output[0]))
+    loaded = output[1] if len(output) > 1 else ""
+
+print(
+    "Import time of {}: {:.3f} s (median), {:.3f} s (max)".format(
+        ", ".join(modules), statistics.median(times), max(times)
+    )
+)
+
+if loaded:
+    sys.exit("Heavy modules imported at load: {}".format(loaded))
+
+if statistics.median(times) > budget:
+    sys.exit("Import time above the budget of {:.3f} s".format(budget))
@@ -0,0 +1,373 @@
+#
+# Browse the results in data/ from a web browser
+#
+# Serves a page on localhost to pick a scenario (model, degradation options, C-rates
+# and number of cycles) and plot its capacity fade, porosity profiles or voltage
+# curves at any cycles. The curves are downsampled before being sent. They are read
+# from the files written while cycling (see cycle_summary.py), so the simulations are
+# not loaded, except for the porosity of simulations run before the porosity files
+# were written. Those profiles are computed from the simulation the first time they
+# are requested, which can take minutes for thousands of cycles, and cached in
+# data/browser_cache/. The list of scenarios is read once and refreshed on request.
+#
+
+import os
+import csv
+import json
+import argparse
+import functools
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+from catalog import build_catalog, TAGS
+from auxiliary_functions import create_C_tag, downsample_lttb
+
+# Change settings here
+port = 8000
+directory = "data"
+cache_directory = os.path.join("data", "browser_cache")
+N_points = 1000  # maximum number of points per curve sent to the browser
+
+
+def list_scenarios(refresh=False):
+    """
+    Returns the scenarios in the data directory, indexed by the part of the filenames
+    shared by their simulation, summary and RPT files. The directory is only scanned
+    the first time and when refresh is True.
+    """
+    if refresh:
+        scan_scenarios.cache_clear()
+    return scan_scenarios()
+
+
+@functools.lru_cache(maxsize=1)
+def scan_scenarios():
+    scenarios = {}
+    for record in build_catalog(directory).values():
+        root = os.path.splitext(record["file"])[0]
+        # Remove the kind (and the C-rate of the RPTs) from the filename
+        scenario = root.split("_", 2 if record["kind"] == "RPT" else 1)[-1]
+        if scenario not in scenarios:
+            scenarios[scenario] = {
+                key: record.get(key)
+                for key in ["model", "C_dch", "C_ch", "N_cycles", "mesh"] + TAGS
+            }
+            scenarios[scenario]["files"] = {}
+            scenarios[scenario]["label"] = describe(scenarios[scenario])
+        scenarios[scenario]["files"].setdefault(record["kind"], []).append(
+            record["file"]
+        )
+    return scenarios
+
+
+def describe(scenario):
+    C_rates = [
+        C if isinstance(C, str) else create_C_tag(C)
+        for C in [scenario["C_dch"], scenario["C_ch"]]
+    ]
+    tags = [tag for tag in TAGS if scenario[tag]] or ["no degradation"]
+    label = "{} - {} discharge, {} charge - {} - {} cycles".format(
+        scenario["model"], *C_rates, ", ".join(tags), scenario["N_cycles"]
+    )
+    if scenario["mesh"]:
+        label += " - {} mesh".format(scenario["mesh"])
+    return label
+
+
+@functools.lru_cache(maxsize=64)
+def read_columns(filename, mtime, x, y):
+    """Reads two columns of a csv file (the modification time keys the cache)."""
+    with open(os.path.join(directory, filename), newline="") as f:
+        rows = [row for row in csv.DictReader(f) if row.get(y)]
+    return downsample_lttb(
+        [float(row[x]) for row in rows], [float(row[y]) for row in rows], N_points
+    )
+
+
+def mtime(filename):
+    return os.path.getmtime(os.path.join(directory, filename))
+
+
+@functools.lru_cache(maxsize=2)
+def load_sim(filename, mtime):
+    import pybamm
+
+    print("Loading {}".format(filename))
+    return pybamm.load_sim(os.path.join(directory, filename))
+
+
+def cached(name, source, compute):
+    """
+    Returns the arrays stored in the cache file `name`, or computes them with
+    `compute` and stores them if they are missing or older than the source file.
+    """
+    path = os.path.join(cache_directory, name + ".npz")
+    if os.path.exists(path) and os.path.getmtime(path) > mtime(source):
+        with np.load(path) as data:
+            return dict(data)
+    arrays = compute()
+    os.makedirs(cache_directory, exist_ok=True)
+    np.savez(path, **arrays)
+    return arrays
+
+
+def capacity(scenario, files, cycles):
+    series = []
+    for filename in files.get("summary", []):
+        x, y = read_columns(filename, mtime(filename), "Cycle number", "Capacity [A.h]")
+        series.append({"label": "Theoretical", "x": x, "y": y})
+    for filename in sorted(files.get("RPT", [])):
+        x, y = read_columns(
+            filename, mtime(filename), "Cycle number", "Discharge capacity [A.h]"
+        )
+        series.append({"label": "RPT " + filename.split("_")[1], "x": x, "y": y})
+    return "Cycle number", "Capacity [A.h]", series
+
+
+@functools.lru_cache(maxsize=8)
+def read_profiles(filename, mtime):
+    """
+    Reads a file of cycle_summary.ProfileWriter (the modification time keys the
+    cache), as the arrays "x" and "porosity" (one row per cycle).
+    """
+    with open(os.path.join(directory, filename), newline="") as f:
+        reader = csv.reader(f)
+        x = np.array(next(reader)[1:], dtype=float)
+        rows = [row for row in reader if len(row) == len(x) + 1]
+    return {"x": x, "porosity": np.array([row[1:] for row in rows], dtype=float)}
+
+
+def porosity_profiles(scenario, files):
+    """
+    Returns the porosity profiles of all the cycles of a scenario, as the arrays
+    "x" and "porosity" (one row per cycle). They are read from the porosity file or,
+    if there is none, computed from the simulation the first time.
+    """
+    from auxiliary_functions import get_profiles_at_cycles
+
+    if "porosity" in files:
+        filename = files["porosity"][0]
+        return read_profiles(filename, mtime(filename))
+
+    filename = files["sim"][0]
+
+    def compute():
+        sim = load_sim(filename, mtime(filename))
+        x, values = get_profiles_at_cycles(
+            sim.solution, "Negative electrode porosity", "x_n [m]"
+        )
+        return {"x": x, "porosity": values}
+
+    return cached("porosity_" + scenario, filename, compute)
+
+
+@functools.lru_cache(maxsize=8)
+def read_curves(filename, mtime):
+    """
+    Returns the cycle numbers and the discharge curves (Q, V) of a voltage file
+    (the modification time keys the cache), whose voltages are equally spaced in
+    discharge capacity.
+    """
+    import pandas as pd
+
+    data = pd.read_csv(os.path.join(directory, filename)).dropna()
+    cycles = data["Cycle number"].to_numpy()
+    Q_end = data["Discharge capacity [A.h]"].to_numpy()
+    V = data.iloc[:, 2:].to_numpy()
+    Q = Q_end[:, np.newaxis] * np.linspace(0, 1, V.shape[1])
+    return cycles, list(zip(Q, V))
+
+
+def porosity(scenario, files, cycles):
+    profiles = porosity_profiles(scenario, files)
+    cycles = [cycle for cycle in cycles if 1 <= cycle <= len(profiles["porosity"])]
+    series = [
+        {
+            "label": "Cycle {}".format(cycle),
+            "x": profiles["x"],
+            "y": profiles["porosity"][cycle - 1],
+        }
+        for cycle in cycles
+    ]
+    return "x [m]", "Negative electrode porosity", series
+
+
+def voltage(scenario, files, cycles):
+    filename = files["voltage"][0]
+    stored_cycles, curves = read_curves(filename, mtime(filename))
+    series = []
+    for cycle in cycles:
+        i = np.searchsorted(stored_cycles, cycle)
+        if i == len(stored_cycles) or stored_cycles[i] != cycle:
+            continue
+        x, y = downsample_lttb(*curves[i], N_points)
+        series.append({"label": "Cycle {}".format(cycle), "x": x, "y": y})
+    return "Discharge capacity [A.h]", "Terminal voltage [V]", series
+
+
+PLOTS = {"capacity": capacity, "porosity": porosity, "voltage": voltage}
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: value[0] for key, value in parse_qs(url.query).items()}
+        try:
+            if url.path == "/":
+                self.send(PAGE.encode(), "text/html")
+            elif url.path == "/scenarios":
+                self.send_json(list_scenarios(refresh="refresh" in query))
+            elif url.path[1:] in PLOTS:
+                scenario = query["scenario"]
+                files = list_scenarios()[scenario]["files"]
+                cycles = [
+                    int(cycle) for cycle in query.get("cycles", "").split(",") if cycle
+                ]
+                xlabel, ylabel, series = PLOTS[url.path[1:]](scenario, files, cycles)
+                for curve in series:
+                    curve["x"] = np.asarray(curve["x"]).tolist()
+                    curve["y"] = np.asarray(curve["y"]).tolist()
+                self.send_json({"xlabel": xlabel, "ylabel": ylabel, "series": series})
+            else:
+                self.send_error(404)
+        except (KeyError, ValueError) as e:
+            self.send_error(400, "Bad request: {}".format(e))
+        except Exception as e:
+            self.send_error(500, str(e))
+
+    def send(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data):
+        self.send(json.dumps(data).encode(), "application/json")
+
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Results browser</title>
+<style>
+body { font-family: sans-serif; margin: 20px; }
+label { margin-right: 12px; }
+canvas { border: 1px solid #ccc; margin-top: 12px; }
+</style>
+</head>
+<body>
+<div>
+  <label>Scenario <select id="scenario"></select></label>
+  <label>Plot <select id="plot">
+    <option>capacity</option><option>porosity</option><option>voltage</option>
+  </select></label>
+  <label>Cycles <input id="cycles" value="1,100,1000" size="20"></label>
+  <button id="draw">Plot</button>
+  <button id="refresh">Refresh scenarios</button>
+  <span id="status"></span>
+</div>
+<canvas id="canvas" width="900" height="550"></canvas>
+<script>
+const colors = ["#000000", "#EE7733", "#0077BB", "#33BBEE", "#EE3377", "#CC3311",
+                "#009988", "#BBBBBB"];
+const $ = (id) => document.getElementById(id);
+
+function ticks(min, max) {
+  const step = Math.pow(10, Math.floor(Math.log10((max - min) / 5 || 1)));
+  const n = (max - min) / step;
+  const size = step * (n > 25 ? 5 : n > 10 ? 2 : 1);
+  const values = [];
+  for (let v = Math.ceil(min / size) * size; v <= max + size / 1e6; v += size) {
+    values.push(v);
+  }
+  return values;
+}
+
+function draw(data) {
+  const canvas = $("canvas"), ctx = canvas.getContext("2d");
+  const margin = {left: 80, right: 170, top: 20, bottom: 50};
+  const w = canvas.width - margin.left - margin.right;
+  const h = canvas.height - margin.top - margin.bottom;
+  ctx.clearRect(0, 0, canvas.width, canvas.height);
+  const xs = data.series.flatMap((s) => s.x), ys = data.series.flatMap((s) => s.y);
+  if (xs.length === 0) { $("status").textContent = "Nothing to plot"; return; }
+  const xmin = Math.min(...xs), xmax = Math.max(...xs);
+  let ymin = Math.min(...ys), ymax = Math.max(...ys);
+  if (ymin === ymax) { ymin -= 1; ymax += 1; }
+  const X = (x) => margin.left + (x - xmin) / (xmax - xmin || 1) * w;
+  const Y = (y) => margin.top + h - (y - ymin) / (ymax - ymin) * h;
+
+  ctx.strokeStyle = "#000"; ctx.fillStyle = "#000"; ctx.font = "12px sans-serif";
+  ctx.strokeRect(margin.left, margin.top, w, h);
+  ctx.textAlign = "center";
+  for (const x of ticks(xmin, xmax)) {
+    ctx.fillText(+x.toPrecision(6), X(x), margin.top + h + 16);
+  }
+  ctx.fillText(data.xlabel, margin.left + w / 2, margin.top + h + 40);
+  ctx.textAlign = "right";
+  for (const y of ticks(ymin, ymax)) {
+    ctx.fillText(+y.toPrecision(6), margin.left - 6, Y(y) + 4);
+  }
+  ctx.save();
+  ctx.translate(16, margin.top + h / 2); ctx.rotate(-Math.PI / 2);
+  ctx.textAlign = "center"; ctx.fillText(data.ylabel, 0, 0);
+  ctx.restore();
+
+  ctx.textAlign = "left";
+  data.series.forEach((s, i) => {
+    ctx.strokeStyle = colors[i % colors.length];
+    ctx.beginPath();
+    s.x.forEach((x, j) => {
+      if (j) { ctx.lineTo(X(x), Y(s.y[j])); } else { ctx.moveTo(X(x), Y(s.y[j])); }
+    });
+    ctx.stroke();
+    const top = margin.top + 10 + 18 * i;
+    ctx.beginPath(); ctx.moveTo(margin.left + w + 10, top);
+    ctx.lineTo(margin.left + w + 30, top); ctx.stroke();
+    ctx.fillStyle = "#000"; ctx.fillText(s.label, margin.left + w + 36, top + 4);
+  });
+}
+
+async function plot() {
+  const params = new URLSearchParams(
+    {scenario: $("scenario").value, cycles: $("cycles").value});
+  $("status").textContent = "Loading...";
+  const start = performance.now();
+  const response = await fetch(`/${$("plot").value}?${params}`);
+  if (!response.ok) { $("status").textContent = await response.text(); return; }
+  draw(await response.json());
+  $("status").textContent = `${((performance.now() - start) / 1000).toFixed(2)} s`;
+}
+
+async function loadScenarios(refresh) {
+  const response = await fetch(refresh ? "/scenarios?refresh=1" : "/scenarios");
+  const scenarios = await response.json();
+  const selected = $("scenario").value;
+  $("scenario").length = 0;
+  for (const [id, s] of Object.entries(scenarios)) {
+    $("scenario").add(new Option(s.label, id, false, id === selected));
+  }
+}
+
+loadScenarios(false);
+$("draw").onclick = plot;
+$("refresh").onclick = () => loadScenarios(true);
+</script>
+</body>
+</html>
+"""
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Browse the results in data/")
+    parser.add_argument("--port", type=int, default=port)
+    args = parser.parse_args()
+
+    server = HTTPServer(("localhost", args.port), Handler)
+    print("Serving the results at http://localhost:{}".format(args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
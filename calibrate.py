@@ -0,0 +1,203 @@
+#
+# Calibrate the degradation rate constants of SPMe+SR against measured capacities
+#
+# The candidate parameter sets are evaluated in parallel by a pool of workers. Each
+# worker builds the model once, with the calibrated parameters as input parameters,
+# and reuses it for all the candidates it evaluates. A candidate is stopped early if,
+# after early_stop_cycles, its error is already much larger than the best so far.
+# The candidates are generated with the cross-entropy method in log scale.
+#
+
+import os
+import csv
+import multiprocessing
+import numpy as np
+import pandas as pd
+from auxiliary_functions import create_filename, create_model_options, starting_state
+
+# Change settings here
+data_filename = os.path.join("data", "measured_capacity.csv")
+parameters = {
+    # name: (lower bound, upper bound), the search is done in log scale
+    "SEI kinetic rate constant [m.s-1]": (1e-14, 1e-10),
+    "Lithium plating kinetic rate constant [m.s-1]": (1e-13, 1e-9),
+}
+options = {"SEI": True, "plating": True, "porosity": True}
+C_dch = 1
+C_ch = 1 / 2
+C_RPT = 1 / 3
+N_candidates = 16  # candidates per generation
+N_generations = 10
+N_elite = 4  # best candidates used to generate the next generation
+early_stop_cycles = 50  # cycles after which hopeless candidates are stopped
+early_stop_factor = 3  # stop if the error is this times larger than the best
+processes = None  # number of workers, all the cores by default
+
+worker = {}
+
+
+class StopCandidate(Exception):
+    pass
+
+
+def init_worker(options, C_dch, C_ch, C_RPT, names):
+    """Builds the cycling and RPT simulations once per worker."""
+    import pybamm
+    from auxiliary_functions import set_parameters, RPT_experiment, cycling_experiment
+
+    pybamm.set_logging_level("WARNING")
+    model = pybamm.lithium_ion.SPMe(
+        name="SPMe+SR", options=create_model_options(options)
+    )
+    param = set_parameters()
+    param.update({name: "[input]" for name in names})
+
+    experiment = cycling_experiment(C_dch, C_ch)
+    worker["cycling"] = pybamm.Simulation(
+        model,
+        parameter_values=param,
+        experiment=experiment,
+        solver=pybamm.CasadiSolver("safe"),
+    )
+    worker["RPT"] = pybamm.Simulation(
+        model,
+        parameter_values=param,
+        experiment=RPT_experiment(C_RPT),
+        solver=pybamm.CasadiSolver("safe"),
+    )
+
+
+def RPT_capacity(state, inputs):
+    solution = worker["RPT"].solve(
+        starting_solution=starting_state(state), calc_esoh=False, inputs=inputs
+    )
+    Q = solution.cycles[-1]["Discharge capacity [A.h]"].entries
+    return Q[-1] - Q[0]
+
+
+def evaluate(args):
+    """
+    Returns the root mean square error of the RPT capacities of a candidate, the
+    number of cycles simulated and whether the candidate was stopped before the last
+    measured cycle (early stopping or failure), in which case the error is that of the
+    cycles simulated.
+    """
+    from auxiliary_functions import solve_cycles
+
+    inputs, data, best = args
+    measured = dict(zip(data["Cycle number"], data["Discharge capacity [A.h]"]))
+    errors = []
+    progress = {"cycles": 0}
+
+    def compare(cycle, first_state):
+        progress["cycles"] = cycle + 1
+        if cycle + 1 in measured:
+            Q = RPT_capacity(first_state, inputs)
+            errors.append(Q - measured[cycle + 1])
+        if cycle + 1 >= early_stop_cycles and errors:
+            if np.sqrt(np.mean(np.square(errors))) > early_stop_factor * best:
+                raise StopCandidate
+
+    try:
+        solve_cycles(
+            worker["cycling"],
+            max(measured),
+            save_at_cycles=[1],
+            on_cycle_end=compare,
+            inputs=inputs,
+            calc_esoh=False,
+        )
+    except StopCandidate:
+        pass
+    except Exception as e:
+        print("Candidate {} failed: {}".format(inputs, e))
+
+    rmse = np.sqrt(np.mean(np.square(errors))) if errors else np.inf
+    return rmse, progress["cycles"], len(errors) < len(measured)
+
+
+if __name__ == "__main__":
+    data = pd.read_csv(data_filename)
+    names = list(parameters)
+    log_bounds = np.log10(np.array([parameters[name] for name in names]))
+
+    output_filename = os.path.join(
+        "data",
+        "calibration_"
+        + create_filename({"name": "SPMe_SR", **options}, C_dch, C_ch)
+        + ".csv",
+    )
+
+    rng = np.random.default_rng(0)
+    mean = log_bounds.mean(axis=1)
+    initial_std = (log_bounds[:, 1] - log_bounds[:, 0]) / 4
+    std = initial_std
+    best = (np.inf, None)
+
+    with multiprocessing.Pool(
+        processes,
+        initializer=init_worker,
+        initargs=(options, C_dch, C_ch, C_RPT, names),
+    ) as pool, open(output_filename, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            ["Generation"] + names + ["RMSE [A.h]", "Cycles simulated", "Stopped"]
+        )
+
+        for generation in range(N_generations):
+            candidates = np.clip(
+                rng.normal(mean, std, (N_candidates, len(names))),
+                log_bounds[:, 0],
+                log_bounds[:, 1],
+            )
+            inputs = [dict(zip(names, 10**candidate)) for candidate in candidates]
+            results = pool.map(
+                evaluate, [(candidate, data, best[0]) for candidate in inputs]
+            )
+
+            scores = []
+            for candidate, (rmse, N_simulated, stopped) in zip(inputs, results):
+                writer.writerow(
+                    [generation + 1]
+                    + [candidate[name] for name in names]
+                    + [rmse, N_simulated, stopped]
+                )
+                # Candidates stopped early are not used to update the distribution
+                scores.append(np.inf if stopped else rmse)
+                if scores[-1] < best[0]:
+                    best = (rmse, candidate)
+            f.flush()
+
+            # Update the sampling distribution with the best candidates. If none
+            # completed the measured cycles, widen it around the same mean instead
+            N_completed = np.sum(np.isfinite(scores))
+            if N_completed == 0:
+                std = np.minimum(2 * std, initial_std)
+                print(
+                    "Generation {}: no candidate completed, widening the "
+                    "sampling".format(generation + 1)
+                )
+                continue
+            elite = candidates[np.argsort(scores)[: min(N_elite, N_completed)]]
+            mean = elite.mean(axis=0)
+            if len(elite) > 1:
+                std = elite.std(axis=0) + 1e-3
+
+            print(
+                "Generation {}: best RMSE {:.2e} A.h, {} of {} stopped early".format(
+                    generation + 1,
+                    best[0],
+                    sum(result[2] for result in results),
+                    N_candidates,
+                )
+            )
+
+    if best[1] is None:
+        print(
+            "No candidate completed the measured cycles, see {} for the errors of "
+            "the cycles simulated".format(output_filename)
+        )
+    else:
+        print("Best parameters (RMSE {:.2e} A.h):".format(best[0]))
+        for name in names:
+            print("  {}: {:.3e}".format(name, best[1][name]))
@@ -0,0 +1,224 @@
+#
+# Catalog of the simulation and RPT outputs stored in data/
+#
+
+import os
+import re
+import json
+import argparse
+from datetime import datetime
+from auxiliary_functions import parse_C_tag
+
+CATALOG_FILENAME = "catalog.json"
+KINDS = ["sim", "RPT", "summary", "voltage", "porosity"]
+TAGS = ["SEI", "plating", "porosity"]
+EXTENSIONS = [".pkl", ".csv"]
+# Mesh tag of auxiliary_functions.create_mesh_tag, e.g. graded10x10-stretchx1
+MESH_TAG = re.compile(r"(uniform|graded)(\d+)x(\d+)(-.*)?$")
+
+
+def parse_filename(filename):
+    """
+    Inverse of the naming used by the scripts, e.g.
+    `RPT_C3_SPMe_SR_1C_C2_plating_porosity_uniform10x10_1000.csv`, where the mesh tag
+    is only there if the mesh is not PyBaMM's default. Returns a dictionary with the
+    metadata, or None if the filename does not follow the naming convention.
+    """
+    root, ext = os.path.splitext(filename)
+    if ext not in EXTENSIONS:
+        return None
+
+    parts = root.split("_")
+    if parts[0] not in KINDS or not parts[-1].isdigit():
+        return None
+
+    metadata = {"kind": parts.pop(0), "N_cycles": int(parts.pop())}
+
+    mesh = MESH_TAG.match(parts[-1]) if parts else None
+    if mesh:
+        metadata.update(
+            {
+                "mesh": parts.pop(),
+                "grading": mesh.group(1),
+                "Nx": int(mesh.group(2)),
+                "Nr": int(mesh.group(3)),
+            }
+        )
+
+    for tag in reversed(TAGS):
+        metadata[tag] = parts[-1] == tag
+        if metadata[tag]:
+            parts.pop()
+
+    if len(parts) < 3 + (metadata["kind"] == "RPT"):
+        return None
+
+    try:
+        if metadata["kind"] == "RPT":
+            metadata["C_RPT"] = parse_C_tag(parts.pop(0))
+        metadata["C_ch"] = parse_C_tag(parts.pop())
+    except ValueError:
+        return None
+    # The discharge can be given as a string (e.g. a drive cycle name)
+    C_dch = parts.pop()
+    try:
+        metadata["C_dch"] = parse_C_tag(C_dch)
+    except ValueError:
+        metadata["C_dch"] = C_dch
+    metadata["model"] = "_".join(parts)
+
+    return metadata
+
+
+def read_sidecar(path):
+    """Reads the metadata written by :func:`auxiliary_functions.write_metadata`."""
+    try:
+        with open(path + ".json") as f:
+            sidecar = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    metadata = {"parameters": sidecar.get("parameters")}
+    var_pts = sidecar.get("var_pts")
+    if var_pts:
+        metadata["Nx"] = var_pts.get("x_n")
+        metadata["Nr"] = var_pts.get("r_n")
+    if "grading" in sidecar:
+        metadata["grading"] = sidecar["grading"]
+    if "RPT_at_cycles" in sidecar:
+        metadata["RPT_at_cycles"] = sidecar["RPT_at_cycles"]
+
+    return metadata
+
+
+def build_catalog(directory="data", refresh=True):
+    """
+    Returns the catalog of the outputs in `directory` as a dictionary of records
+    indexed by filename. The catalog is stored in the directory and, on refresh, only
+    the files that are new or have changed since the last refresh are parsed.
+    """
+    catalog_path = os.path.join(directory, CATALOG_FILENAME)
+    try:
+        with open(catalog_path) as f:
+            catalog = json.load(f)
+    except (OSError, ValueError):
+        catalog = {}
+
+    if not refresh:
+        return catalog
+
+    new_catalog = {}
+    for entry in os.scandir(directory):
+        if not entry.is_file():
+            continue
+        stat = entry.stat()
+        # The sidecar can be written or updated after the file, so it is part of the key
+        try:
+            sidecar_mtime = os.path.getmtime(entry.path + ".json")
+        except OSError:
+            sidecar_mtime = None
+        record = catalog.get(entry.name)
+        if record and (
+            record["mtime"],
+            record["size"],
+            record.get("sidecar_mtime"),
+        ) == (stat.st_mtime, stat.st_size, sidecar_mtime):
+            new_catalog[entry.name] = record
+            continue
+
+        metadata = parse_filename(entry.name)
+        if metadata is None:
+            continue
+        metadata.update(read_sidecar(entry.path))
+        metadata.update(
+            {
+                "file": entry.name,
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "sidecar_mtime": sidecar_mtime,
+                "created": datetime.fromtimestamp(stat.st_mtime).isoformat(
+                    timespec="seconds"
+                ),
+            }
+        )
+        new_catalog[entry.name] = metadata
+
+    if new_catalog != catalog:
+        with open(catalog_path, "w") as f:
+            json.dump(new_catalog, f, indent=1)
+
+    return new_catalog
+
+
+def query(catalog, **criteria):
+    """
+    Returns the records of the catalog matching all the criteria, e.g.
+    `query(catalog, kind="RPT", model="DFN_SR", C_dch=1)`. C-rates are compared up to
+    the two decimal places used in the filenames.
+    """
+    records = []
+    for record in catalog.values():
+        for key, value in criteria.items():
+            entry = record.get(key)
+            if isinstance(value, float) and isinstance(entry, float):
+                if abs(entry - value) > 5e-3:
+                    break
+            elif entry != value:
+                break
+        else:
+            records.append(record)
+
+    return sorted(records, key=lambda record: record["file"])
+
+
+def parse_value(value):
+    """Converts the command line values to the types stored in the catalog."""
+    if not value:
+        raise ValueError("Empty value, criteria must be of the form key=value")
+    if value.lower() in ["true", "false"]:
+        return value.lower() == "true"
+    for convert in [int, float, parse_C_tag]:
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return value
+
+
+if __name__ == "__main__":
+    from prettytable import PrettyTable
+
+    parser = argparse.ArgumentParser(description="Query the outputs in data/")
+    parser.add_argument("--directory", default="data")
+    parser.add_argument(
+        "--no-refresh",
+        action="store_true",
+        help="use the stored catalog without scanning the directory",
+    )
+    parser.add_argument(
+        "criteria",
+        nargs="*",
+        help="criteria of the form key=value, e.g. kind=RPT model=DFN_SR C_dch=1C",
+    )
+    args = parser.parse_args()
+
+    criteria = {}
+    for criterion in args.criteria:
+        key, _, value = criterion.partition("=")
+        try:
+            criteria[key] = parse_value(value)
+        except ValueError as e:
+            parser.error("{}: {}".format(criterion, e))
+
+    catalog = build_catalog(args.directory, refresh=not args.no_refresh)
+    records = query(catalog, **criteria)
+
+    columns = ["file", "kind", "model", "C_dch", "C_ch", "N_cycles", "C_RPT"]
+    columns += TAGS + ["Nx", "Nr", "grading", "parameters", "size", "created"]
+    table = PrettyTable(columns)
+    for record in records:
+        row = [record.get(column, "") for column in columns]
+        if row[columns.index("parameters")]:
+            row[columns.index("parameters")] = row[columns.index("parameters")][:8]
+        table.add_row(row)
+    print(table)
@@ -0,0 +1,185 @@
+#
+# Check that the results have not changed against the committed reference
+#
+# Runs a few cycles of SPMe+SR and DFN+SR on a coarse mesh through the same functions
+# as the main scripts (run_cycling with a mesh from create_mesh and compressed states,
+# loading the saved simulation, RPTs, re-running a cycle and evaluating the porosity
+# profiles) and compares the outputs against regression_reference.json with the
+# tolerances below. The outputs are written to a temporary directory. Run with
+# --update to regenerate the reference after an intended change of the results.
+#
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+
+# Change settings here
+reference_filename = "regression_reference.json"
+models = {"SPMe+SR": "SPMe", "DFN+SR": "DFN"}
+options = {"SEI": True, "plating": True, "porosity": True}
+N_cycles = 2
+C_dch = 1
+C_ch = 1 / 2
+C_RPT = 1 / 3
+mesh = {"Nx": 5, "Nr": 5}
+archive_options = {"encoding": "lossless"}
+N_points = 50  # points to sample the voltage of the re-run cycle
+tolerances = {
+    # quantity: (relative tolerance, absolute tolerance), a few orders of magnitude
+    # above the differences between runs, so that e.g. a shift of 0.05 s of a cut-off
+    # or of 0.1 mV in a voltage fails
+    "RPT capacity [A.h]": (0, 1e-6),
+    "Step duration [s]": (0, 1e-2),
+    "Discharge capacity [A.h]": (0, 1e-6),
+    "Discharge voltage [V]": (0, 1e-5),
+    "Re-run voltage [V]": (0, 1e-5),
+    "Negative electrode porosity": (0, 1e-8),
+    "Loss of lithium inventory [%]": (0, 1e-6),
+}
+
+
+def sample_voltage(solution):
+    """Samples the voltage of a cycle at equally spaced fractions of its duration."""
+    t = solution["Time [s]"].entries
+    V = solution["Terminal voltage [V]"].entries
+    return np.interp(np.linspace(t[0], t[-1], N_points), t, V).tolist()
+
+
+def run_case(name):
+    """Returns the reference quantities of a model."""
+    import pybamm
+    import pandas as pd
+    from auxiliary_functions import (
+        create_model_options,
+        get_profiles_at_cycles,
+        run_cycle,
+        run_cycling,
+        run_RPT,
+        set_parameters,
+    )
+    from cycle_summary import add_porosity_summary_variables
+
+    model = getattr(pybamm.lithium_ion, models[name])(
+        name=name, options=create_model_options(options)
+    )
+    add_porosity_summary_variables(model)
+
+    # Run in a temporary directory, as the main scripts write to data/
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            os.mkdir("data")
+            sim_filename = run_cycling(
+                model,
+                set_parameters(),
+                C_dch,
+                C_ch,
+                N_cycles,
+                options=options,
+                archive_options=archive_options,
+                mesh=mesh,
+            )
+            sim = pybamm.load_sim(sim_filename)
+            # RPTs at the first and last cycles
+            RPT = run_RPT(
+                sim,
+                C_rate=C_RPT,
+                RPT_at_cycles=[0, N_cycles - 1],
+                lean=True,
+                filename=os.path.join("data", "RPT.csv"),
+            )
+            outputs = {
+                kind: pd.read_csv(glob.glob(os.path.join("data", kind + "_*.csv"))[0])
+                for kind in ["summary", "voltage", "porosity"]
+            }
+        finally:
+            os.chdir(cwd)
+
+    # The porosity profiles written while cycling and those of the saved states
+    _, porosity = get_profiles_at_cycles(
+        sim.solution, "Negative electrode porosity", "x_n [m]"
+    )
+    rerun = run_cycle(sim, N_cycles - 1).solution
+
+    summary = outputs["summary"]
+    durations = [column for column in summary if column.endswith("duration [s]")]
+    return {
+        "RPT capacity [A.h]": RPT["Discharge capacity [A.h]"].tolist(),
+        "Step duration [s]": summary[durations].to_numpy().tolist(),
+        "Discharge capacity [A.h]": outputs["voltage"].iloc[:, 1].tolist(),
+        "Discharge voltage [V]": outputs["voltage"].iloc[:, 2:].to_numpy().tolist(),
+        "Re-run voltage [V]": sample_voltage(rerun),
+        "Negative electrode porosity": np.concatenate(
+            [outputs["porosity"].iloc[:, 1:].to_numpy(), porosity]
+        ).tolist(),
+        "Loss of lithium inventory [%]": summary[
+            "Loss of lithium inventory [%]"
+        ].tolist(),
+    }
+
+
+def compare(results, reference):
+    """Prints the maximum error of each quantity and returns the failed quantities."""
+    failed = []
+    for quantity, (rtol, atol) in tolerances.items():
+        new = np.array(results[quantity], dtype=float)
+        ref = np.array(reference[quantity], dtype=float)
+        if new.shape != ref.shape:
+            print("  {}: shape {} instead of {}".format(quantity, new.shape, ref.shape))
+            failed.append(quantity)
+            continue
+        error = np.max(np.abs(new - ref))
+        ok = np.allclose(new, ref, rtol=rtol, atol=atol)
+        print("  {}: max error {:.2e} {}".format(quantity, error, "" if ok else "FAIL"))
+        if not ok:
+            failed.append(quantity)
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the results against the regression reference"
+    )
+    parser.add_argument(
+        "--update", action="store_true", help="regenerate the reference results"
+    )
+    args = parser.parse_args()
+    if not args.update and not os.path.exists(reference_filename):
+        sys.exit(
+            "No reference results in {}, run `python check_regression.py --update` "
+            "to generate them".format(reference_filename)
+        )
+
+    import pybamm
+
+    pybamm.set_logging_level("WARNING")
+
+    start = time.perf_counter()
+    results = {name: run_case(name) for name in models}
+
+    if args.update:
+        with open(reference_filename, "w") as f:
+            json.dump({"pybamm": pybamm.__version__, **results}, f, indent=1)
+        print("Reference written to {}".format(reference_filename))
+        sys.exit()
+
+    with open(reference_filename) as f:
+        reference = json.load(f)
+    if reference.pop("pybamm", None) != pybamm.__version__:
+        print("Warning: the reference was generated with another version of PyBaMM")
+
+    failed = []
+    for name in models:
+        print(name)
+        for quantity in compare(results[name], reference[name]):
+            failed.append(name + ": " + quantity)
+    print("Elapsed time: {:.1f} s".format(time.perf_counter() - start))
+
+    if failed:
+        sys.exit("Regression check failed for {}".format(", ".join(failed)))
@@ -0,0 +1,135 @@
+#
+# Accuracy against system size of uniform and graded meshes
+#
+# Cycles SPMe+SR and DFN+SR on uniform and graded meshes (see graded_mesh.py) of
+# increasing size and compares the voltage, capacity, loss of lithium inventory and
+# minimum porosity against a fine uniform mesh. A graded mesh is worth using if it
+# reaches the accuracy of a uniform mesh with fewer unknowns. So far none does, see
+# the README.
+#
+
+import time
+import pybamm
+import numpy as np
+import pandas as pd
+from prettytable import PrettyTable
+from auxiliary_functions import (
+    create_mesh,
+    create_model_options,
+    cycling_experiment,
+    set_parameters,
+    solve_cycles,
+)
+from cycle_summary import add_porosity_summary_variables
+
+pybamm.set_logging_level("WARNING")
+
+# Change settings here
+models = {"SPMe+SR": "SPMe", "DFN+SR": "DFN"}
+options = {"SEI": True, "plating": True, "porosity": True}
+N_cycles = 10
+C_dch = 1
+C_ch = 1 / 2
+points = [5, 10, 20]  # Nx = Nr of the meshes compared
+gradings = ["uniform", "graded"]
+reference_points = 60  # Nx = Nr of the reference uniform mesh
+N_points = 100  # points to sample the voltage of each cycle
+output_filename = "graded_mesh_study.csv"
+
+# Summary variables compared, the capacity is computed from each discharge as the
+# eSOH variables are skipped
+SUMMARY_VARIABLES = [
+    "Loss of lithium inventory [%]",
+    "Minimum negative electrode porosity",
+]
+
+
+def run_case(name, N, grading):
+    """Cycles a model and returns its system size, solve time and outputs."""
+    model = getattr(pybamm.lithium_ion, models[name])(
+        name=name, options=create_model_options(options)
+    )
+    add_porosity_summary_variables(model)
+    sim = pybamm.Simulation(
+        model,
+        parameter_values=set_parameters(),
+        experiment=cycling_experiment(C_dch, C_ch),
+        solver=pybamm.CasadiSolver("safe"),
+        **create_mesh(model, N, N, grading=grading)
+    )
+    sim.build_for_experiment()
+    start = time.perf_counter()
+    solution = solve_cycles(sim, N_cycles, calc_esoh=False)
+    solve_time = time.perf_counter() - start
+
+    # Voltage of each cycle at equally spaced fractions of its duration
+    voltage = []
+    capacity = []
+    for cycle in solution.cycles:
+        t = cycle["Time [s]"].entries
+        V = cycle["Terminal voltage [V]"].entries
+        voltage.append(np.interp(np.linspace(t[0], t[-1], N_points), t, V))
+        Q = cycle.steps[0]["Discharge capacity [A.h]"].entries
+        capacity.append(Q[-1] - Q[0])
+
+    return {
+        "size": solution.all_ys[0].shape[0],
+        "solve time": solve_time,
+        "voltage": np.array(voltage),
+        "capacity": np.array(capacity),
+        **{
+            variable: solution.summary_variables[variable]
+            for variable in SUMMARY_VARIABLES
+        },
+    }
+
+
+def errors(case, reference):
+    """Maximum errors of a case against the reference, over all the cycles."""
+    N = min(len(case["voltage"]), len(reference["voltage"]))
+    return [
+        1e3 * np.max(np.abs(case["voltage"][:N] - reference["voltage"][:N])),
+        np.max(np.abs(case["capacity"][:N] - reference["capacity"][:N])),
+        *[
+            np.max(np.abs(case[variable][:N] - reference[variable][:N]))
+            for variable in SUMMARY_VARIABLES
+        ],
+    ]
+
+
+if __name__ == "__main__":
+    columns = [
+        "Model",
+        "Grading",
+        "Nx = Nr",
+        "# states",
+        "Solve time [s]",
+        "Voltage error [mV]",
+        "Discharge capacity error [A.h]",
+        "LLI error [%]",
+        "Porosity error",
+    ]
+    rows = []
+    for name in models:
+        print("Running {} reference, Nx = Nr = {}".format(name, reference_points))
+        reference = run_case(name, reference_points, "uniform")
+        for grading in gradings:
+            for N in points:
+                print("Running {} {}, Nx = Nr = {}".format(name, grading, N))
+                case = run_case(name, N, grading)
+                rows.append(
+                    [name, grading, N, case["size"], case["solve time"]]
+                    + errors(case, reference)
+                )
+
+    table = PrettyTable(columns)
+    for row in rows:
+        table.add_row(
+            row[:4] + ["{:.2f}".format(row[4])] + ["{:.2e}".format(x) for x in row[5:]]
+        )
+    print(
+        "Maximum errors over {} cycles against a uniform mesh with "
+        "Nx = Nr = {}".format(N_cycles, reference_points)
+    )
+    print(table)
+    pd.DataFrame(rows, columns=columns).to_csv(output_filename)
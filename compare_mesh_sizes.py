@@ -1,16 +1,31 @@
 #
 # Get system size for different mesh sizes
 #
+# The cases are run in parallel, each in a fresh process so its peak memory can be
+# measured, and the results are cached in system_size_cache.json so only the new
+# cases are built when the settings are extended.
+#
 
 
+import os
+import json
+import time
+import multiprocessing
 import pybamm
 import numpy as np
 import pandas as pd
 from auxiliary_functions import set_parameters, create_model_tag
 
+try:
+    import resource
+except ImportError:  # not available in Windows
+    resource = None
+
 pybamm.set_logging_level("WARNING")
 
 factors = [1, 2, 4, 8]
+processes = None  # number of processes, all the cores by default
+cache_filename = "system_size_cache.json"
 
 # Define models
 options = {
@@ -21,62 +36,96 @@ options = {
     "lithium plating": "none",
     "lithium plating porosity change": "true",
 }
-SPMe = pybamm.lithium_ion.SPMe(name="SPMe+SR", options=options)
-DFN = pybamm.lithium_ion.DFN(name="DFN+SR", options=options)
-
-models = [SPMe, DFN]
-
-param = set_parameters()
-
-var = pybamm.standard_spatial_vars
-
-df = pd.DataFrame()
-
-i = 0
-N = len(models) * len(factors) ** 2
-
-data = {}
-
-for model in models:
-    for factor_x in factors:
-        for factor_r in factors:
-            i += 1
-            print(
-                f"Running case {i} of {N}: {model.name}, factor_x = {factor_x},"
-                + f" factor_r = {factor_r}"
-            )
-            var_pts = {
-                var.x_n: 20 * factor_x,
-                var.x_s: 20 * factor_x,
-                var.x_p: 20 * factor_x,
-                var.r_n: 20 * factor_r,
-                var.r_p: 20 * factor_r,
-            }
-            sim = pybamm.Simulation(
-                model,
-                parameter_values=param,
-                var_pts=var_pts,
-            )
-
-            sim.build()
-
-            size_algebraic = np.size(sim.built_model.concatenated_algebraic)
-            size_rhs = np.size(sim.built_model.concatenated_rhs)
-            data[i - 1] = [
-                model.name,
-                20 * factor_x,
-                20 * factor_r,
-                size_rhs,
-                size_algebraic,
-                size_algebraic + size_rhs,
-            ]
-
-df = pd.DataFrame.from_dict(
-    data,
-    orient="index",
-    columns=["Model", "Nx", "Nr", "# rhs", "# algebraic", "# total"],
-)
-
-_, tag = create_model_tag(SPMe)
-filename = "system_size" + tag + ".csv"
-df.to_csv(filename)
+models = {"SPMe+SR": "SPMe", "DFN+SR": "DFN"}
+
+
+def case_key(name, options, Nx, Nr):
+    """Key of a case in the cache, also including the version of PyBaMM."""
+    return json.dumps([pybamm.__version__, name, options, Nx, Nr], sort_keys=True)
+
+
+def system_size(args):
+    """Builds a case and returns its system size, build time and peak memory."""
+    name, options, Nx, Nr = args
+    print(f"Running {name}, Nx = {Nx}, Nr = {Nr}")
+    model = getattr(pybamm.lithium_ion, models[name])(name=name, options=options)
+    var = pybamm.standard_spatial_vars
+    var_pts = {
+        var.x_n: Nx,
+        var.x_s: Nx,
+        var.x_p: Nx,
+        var.r_n: Nr,
+        var.r_p: Nr,
+    }
+    sim = pybamm.Simulation(
+        model,
+        parameter_values=set_parameters(),
+        var_pts=var_pts,
+    )
+    start = time.perf_counter()
+    sim.build()
+    build_time = time.perf_counter() - start
+
+    if resource is None:
+        peak_memory = np.nan
+    else:
+        # Peak resident memory of the process in MB (ru_maxrss is in kB in Linux and
+        # in bytes in MacOS)
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        if os.uname().sysname == "Darwin":
+            peak_memory /= 1024
+
+    size_algebraic = np.size(sim.built_model.concatenated_algebraic)
+    size_rhs = np.size(sim.built_model.concatenated_rhs)
+    return [
+        name,
+        Nx,
+        Nr,
+        size_rhs,
+        size_algebraic,
+        size_algebraic + size_rhs,
+        build_time,
+        peak_memory,
+    ]
+
+
+if __name__ == "__main__":
+    try:
+        with open(cache_filename) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+
+    cases = [
+        (name, options, 20 * factor_x, 20 * factor_r)
+        for name in models
+        for factor_x in factors
+        for factor_r in factors
+    ]
+    new_cases = [case for case in cases if case_key(*case) not in cache]
+    print(f"Running {len(new_cases)} of {len(cases)} cases, the rest are cached")
+
+    # A fresh process for each case, so the peak memory is that of the case
+    with multiprocessing.Pool(processes, maxtasksperchild=1) as pool:
+        for case, result in zip(new_cases, pool.imap(system_size, new_cases)):
+            cache[case_key(*case)] = result
+            with open(cache_filename, "w") as f:
+                json.dump(cache, f, indent=1)
+
+    df = pd.DataFrame(
+        [cache[case_key(*case)] for case in cases],
+        columns=[
+            "Model",
+            "Nx",
+            "Nr",
+            "# rhs",
+            "# algebraic",
+            "# total",
+            "Build time [s]",
+            "Peak memory [MB]",
+        ],
+    )
+
+    _, tag = create_model_tag(pybamm.lithium_ion.SPMe(options=options))
+    filename = "system_size" + tag + ".csv"
+    df.to_csv(filename)
@@ -0,0 +1,211 @@
+#
+# Stream per-cycle summary variables to a file while cycling
+#
+
+import csv
+import time
+import numpy as np
+import pybamm
+
+SUMMARY_VARIABLES = [
+    "Capacity [A.h]",
+    "Measured capacity [A.h]",
+    "Loss of lithium inventory [%]",
+    "Loss of lithium to SEI [mol]",
+    "Loss of capacity to SEI [A.h]",
+    "Loss of lithium to lithium plating [mol]",
+    "Loss of capacity to lithium plating [A.h]",
+    "Minimum negative electrode porosity",
+    "Maximum negative electrode porosity",
+]
+
+
+def electrolyte_concentration_spread(cycle):
+    """
+    Maximum over a cycle of the relative spread of the electrolyte concentration
+    across the cell, (max - min) / mean. The spread builds up during the discharge
+    and relaxes during the CV hold, so it is not captured at the end of the cycle.
+    """
+    c_e = cycle["Electrolyte concentration [mol.m-3]"].entries
+    return np.max((np.max(c_e, axis=0) - np.min(c_e, axis=0)) / np.mean(c_e, axis=0))
+
+
+# Summary variables evaluated over the whole cycle, see solve_cycles
+CYCLE_VARIABLES = {
+    "Maximum electrolyte concentration spread": electrolyte_concentration_spread,
+}
+
+
+def add_porosity_summary_variables(model):
+    """
+    Adds the minimum and maximum negative electrode porosity to the variables of the
+    model and to its summary variables, so they are evaluated at the end of each cycle.
+    """
+    eps_n = model.variables["Negative electrode porosity"]
+    model.variables.update(
+        {
+            "Minimum negative electrode porosity": pybamm.min(eps_n),
+            "Maximum negative electrode porosity": pybamm.max(eps_n),
+        }
+    )
+    model.summary_variables = model.summary_variables + [
+        "Minimum negative electrode porosity",
+        "Maximum negative electrode porosity",
+    ]
+
+    return model
+
+
+class CycleSummaryWriter(pybamm.callbacks.Callback):
+    """
+    Callback that appends one row per cycle to a csv file as soon as the cycle is
+    completed, so the cycle-level data does not need to be kept in memory. Each row
+    holds the cycle number, the summary variables, the simulated duration of each
+    step and the wall time taken to solve it. The durations need the solution of the
+    cycle, which is passed by :func:`solve_cycles` to the callbacks with an
+    `on_cycle_solution` method, so the rows are written then.
+
+    Parameters
+    ----------
+    filename : str
+        The csv file to write to. It is overwritten at the first cycle, and appended
+        to afterwards (e.g. when the cycles are solved in several calls with
+        :func:`solve_cycles`).
+    variables : list of str, optional
+        The summary variables to write. Variables that are not summary variables of the
+        model are skipped. Default is :data:`SUMMARY_VARIABLES`.
+    """
+
+    def __init__(self, filename, variables=None):
+        self.filename = filename
+        self.variables = variables or SUMMARY_VARIABLES
+        self.header = None
+        self.pending = []
+
+    def on_experiment_start(self, logs):
+        # Cycles past the last one requested are solved but never passed to
+        # on_cycle_solution, so drop them
+        self.pending = []
+
+    def on_cycle_start(self, logs):
+        self.step_times = []
+
+    def on_step_start(self, logs):
+        self.step_start = time.perf_counter()
+
+    def on_step_end(self, logs):
+        self.step_times.append(time.perf_counter() - self.step_start)
+
+    def on_cycle_end(self, logs):
+        # Keep the summary variables and wall times until the solution of the cycle
+        # is passed to on_cycle_solution, after the experiment is solved
+        self.pending.append((logs["summary variables"], self.step_times))
+
+    def on_cycle_solution(self, cycle_number, cycle):
+        summary_variables, step_times = self.pending.pop(0)
+        durations = [
+            (step.t[-1] - step.t[0]) * step.timescale_eval for step in cycle.steps
+        ]
+
+        with open(self.filename, "w" if self.header is None else "a", newline="") as f:
+            writer = csv.writer(f)
+            if self.header is None:
+                self.variables = [
+                    var for var in self.variables if var in summary_variables
+                ]
+                self.header = ["Cycle number"] + self.variables
+                self.header += [
+                    "Step {} duration [s]".format(j + 1) for j in range(len(durations))
+                ]
+                self.header += [
+                    "Step {} wall time [s]".format(j + 1)
+                    for j in range(len(step_times))
+                ]
+                writer.writerow(self.header)
+
+            row = [cycle_number]
+            row += [float(summary_variables[var]) for var in self.variables]
+            row += durations + step_times
+            writer.writerow(row)
+
+
+class DischargeCurveWriter(pybamm.callbacks.Callback):
+    """
+    Callback that appends the voltage curve of the discharge (the first step) of each
+    cycle to a csv file, downsampled to N_points equally spaced in discharge capacity.
+    Each row holds the cycle number, the discharge capacity and the voltages. It needs
+    the solution of each cycle, which is passed by :func:`solve_cycles` to the
+    callbacks with an `on_cycle_solution` method.
+
+    Parameters
+    ----------
+    filename : str
+        The csv file to write to. It is overwritten at the first cycle.
+    N_points : int, optional
+        The number of points of each curve. Default is 100.
+    """
+
+    def __init__(self, filename, N_points=100):
+        self.filename = filename
+        self.N_points = N_points
+        self.started = False
+
+    def on_cycle_solution(self, cycle_number, cycle):
+        discharge = cycle.steps[0]
+        Q = discharge["Discharge capacity [A.h]"].entries
+        Q = Q - Q[0]
+        V = discharge["Terminal voltage [V]"].entries
+        V = np.interp(np.linspace(0, Q[-1], self.N_points), Q, V)
+
+        with open(self.filename, "a" if self.started else "w", newline="") as f:
+            writer = csv.writer(f)
+            if not self.started:
+                writer.writerow(
+                    ["Cycle number", "Discharge capacity [A.h]"]
+                    + ["Voltage {} [V]".format(i) for i in range(self.N_points)]
+                )
+                self.started = True
+            writer.writerow([cycle_number, Q[-1]] + V.tolist())
+
+
+class ProfileWriter(pybamm.callbacks.Callback):
+    """
+    Callback that appends a spatially-distributed variable at the first state of each
+    cycle to a csv file, e.g. the porosity profiles, so they can be read without
+    loading the simulation. The header holds "Cycle number" followed by the spatial
+    coordinates and each row the cycle number followed by the values. As
+    :class:`DischargeCurveWriter`, it needs the solution of each cycle, passed by
+    :func:`solve_cycles`.
+
+    Parameters
+    ----------
+    filename : str
+        The csv file to write to. It is overwritten at the first cycle.
+    variable : str, optional
+        The variable to write. Default is "Negative electrode porosity".
+    spatial_variable : str, optional
+        The spatial coordinate of the variable. Default is "x_n [m]".
+    """
+
+    def __init__(
+        self,
+        filename,
+        variable="Negative electrode porosity",
+        spatial_variable="x_n [m]",
+    ):
+        self.filename = filename
+        self.variable = variable
+        self.spatial_variable = spatial_variable
+        self.started = False
+
+    def on_cycle_solution(self, cycle_number, cycle):
+        first_state = cycle.first_state
+        values = first_state[self.variable].entries[:, 0]
+
+        with open(self.filename, "a" if self.started else "w", newline="") as f:
+            writer = csv.writer(f)
+            if not self.started:
+                x = first_state[self.spatial_variable].entries[:, 0]
+                writer.writerow(["Cycle number"] + [repr(float(x_i)) for x_i in x])
+                self.started = True
+            writer.writerow([cycle_number] + values.tolist())
@@ -0,0 +1,78 @@
+#
+# Graded meshes, finer near the particle surfaces and the separator
+#
+# SEI growth and lithium plating act at the particle surface and are strongest in
+# the negative electrode next to the separator, which is also where the electrolyte
+# gradients are steepest. The graded meshes put the points there: the particle
+# meshes are clustered at the surface, the electrode meshes at the separator and the
+# separator mesh at both ends. The stretch is the log of the ratio between the
+# largest and smallest cells for the one-sided meshes.
+#
+
+import numpy as np
+import pybamm
+
+
+class Graded1DSubMesh(pybamm.SubMesh1D):
+    """
+    1D submesh with the points clustered at the left end, the right end or both ends
+    of the interval. Unlike :class:`pybamm.Exponential1DSubMesh`, "both" works on
+    any interval (e.g. the separator).
+
+    Parameters
+    ----------
+    lims : dict
+        A dictionary that contains the limits of the spatial variables
+    npts : dict
+        A dictionary that contains the number of points to be used on each spatial
+        variable
+    side : str, optional
+        "left", "right" or "both" (default)
+    stretch : float, optional
+        Grading factor, 0 gives a uniform mesh. Default is 2.
+    """
+
+    def __init__(self, lims, npts, side="both", stretch=2):
+        spatial_var, spatial_lims, tabs = self.read_lims(lims)
+        a = spatial_lims["min"]
+        b = spatial_lims["max"]
+        npts = npts[spatial_var.name]
+
+        xi = np.linspace(0, 1, npts + 1)
+        if stretch == 0:
+            fraction = xi
+        elif side == "left":
+            fraction = np.expm1(stretch * xi) / np.expm1(stretch)
+        elif side == "right":
+            fraction = 1 - np.expm1(stretch * (1 - xi)) / np.expm1(stretch)
+        elif side == "both":
+            fraction = 0.5 + 0.5 * np.tanh(stretch * (xi - 0.5)) / np.tanh(stretch / 2)
+        else:
+            raise pybamm.GeometryError(
+                "side must be 'left', 'right' or 'both', not '{}'".format(side)
+            )
+        edges = a + (b - a) * fraction
+        # Avoid rounding errors at the ends
+        edges[0], edges[-1] = a, b
+
+        super().__init__(edges, coord_sys=spatial_var.coord_sys, tabs=tabs)
+
+
+def graded_submesh_types(model, stretch_x=1.5, stretch_r=2.3):
+    """
+    Returns the submesh types of a model with graded meshes through the cell
+    (stretch_x) and in the particles (stretch_r).
+    """
+    submesh_types = model.default_submesh_types.copy()
+    sides = {
+        "negative electrode": ("right", stretch_x),
+        "separator": ("both", stretch_x),
+        "positive electrode": ("left", stretch_x),
+        "negative particle": ("right", stretch_r),
+        "positive particle": ("right", stretch_r),
+    }
+    for domain, (side, stretch) in sides.items():
+        submesh_types[domain] = pybamm.MeshGenerator(
+            Graded1DSubMesh, {"side": side, "stretch": stretch}
+        )
+    return submesh_types
@@ -0,0 +1,483 @@
+#
+# Job queue on a shared filesystem, to run the scenarios with many workers
+#
+# Tasks are json files that move between the directories pending/, claimed/, done/
+# and failed/ of the queue. Every transition is a rename, which is atomic on a POSIX
+# filesystem, so any number of workers (on any number of nodes sharing the
+# directory) can claim tasks without a lock. The pending and claimed tasks are split
+# into shards so the workers do not all scan the same directory.
+#
+# A claimed task carries the expiry time of its lease and the worker in its
+# filename. The worker renews the lease while it runs the task, and a task whose
+# lease has expired (e.g. the node died) is put back in the queue by any worker.
+#
+
+import os
+import sys
+import json
+import time
+import socket
+import hashlib
+import argparse
+import threading
+import traceback
+from auxiliary_functions import create_C_tag, create_filename, parse_C_tag
+from catalog import parse_value
+
+N_SHARDS = 16
+STATES = ["pending", "claimed", "done", "failed"]
+C_RATES = ["C_dch", "C_ch", "C_RPT"]
+
+
+class TaskNotReady(Exception):
+    """
+    Raised by a task whose inputs do not exist yet (e.g. a RPT before cycling). The
+    missing files are passed so the worker can check that another task will produce
+    them.
+    """
+
+    def __init__(self, message, missing=None):
+        super().__init__(message)
+        self.missing = missing or []
+
+
+def normalise_settings(settings):
+    """
+    Writes the C-rates in a single form (e.g. 1C, 1 and 1.0 are all 1.0), so the
+    same task submitted with different spellings has the same id.
+    """
+    settings = dict(settings)
+    for key in C_RATES:
+        if key in settings:
+            C_rate = settings[key]
+            if isinstance(C_rate, str):
+                C_rate = parse_C_tag(C_rate)
+            settings[key] = parse_C_tag(create_C_tag(C_rate))
+    return settings
+
+
+def task_id(kind, settings):
+    """Tasks are identified by their kind and settings, so duplicates are merged."""
+    key = json.dumps([kind, normalise_settings(settings)], sort_keys=True)
+    return kind + "_" + hashlib.sha1(key.encode()).hexdigest()[:12]
+
+
+def shard(name):
+    return "{:02d}".format(int(name.split("_")[-1][:12], 16) % N_SHARDS)
+
+
+def task_path(queue_dir, state, name):
+    if state in ["pending", "claimed"]:
+        return os.path.join(queue_dir, state, shard(name), name)
+    return os.path.join(queue_dir, state, name)
+
+
+def claimed_name(name, expiry, worker):
+    return "{}~{:.0f}~{}.json".format(name, expiry, worker)
+
+
+def parse_claimed_name(filename):
+    name, expiry, worker = filename[: -len(".json")].split("~", 2)
+    return name, float(expiry), worker
+
+
+def write_task(queue_dir, path, task):
+    """Writes the task to a temporary file and moves it into place."""
+    tmp_path = os.path.join(queue_dir, "tmp", os.path.basename(path))
+    with open(tmp_path, "w") as f:
+        json.dump(task, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def create_queue(queue_dir):
+    os.makedirs(os.path.join(queue_dir, "tmp"), exist_ok=True)
+    for state in STATES:
+        if state in ["pending", "claimed"]:
+            for i in range(N_SHARDS):
+                os.makedirs(
+                    os.path.join(queue_dir, state, "{:02d}".format(i)), exist_ok=True
+                )
+        else:
+            os.makedirs(os.path.join(queue_dir, state), exist_ok=True)
+
+
+def submit(queue_dir, kind, settings, max_attempts=3):
+    """
+    Adds a task to the queue, unless the same task is already pending, claimed or
+    done. Returns the name of the task.
+    """
+    if kind not in HANDLERS:
+        raise ValueError("Unknown task kind '{}'".format(kind))
+
+    create_queue(queue_dir)
+    settings = normalise_settings(settings)
+    name = task_id(kind, settings) + ".json"
+    claimed = os.listdir(os.path.join(queue_dir, "claimed", shard(name[:-5])))
+    if (
+        os.path.exists(task_path(queue_dir, "pending", name))
+        or os.path.exists(task_path(queue_dir, "done", name))
+        or any(filename.startswith(name[:-5] + "~") for filename in claimed)
+    ):
+        return name
+
+    task = {
+        "kind": kind,
+        "settings": settings,
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "errors": [],
+    }
+    write_task(queue_dir, task_path(queue_dir, "pending", name), task)
+
+    return name
+
+
+def claim(queue_dir, worker, lease):
+    """
+    Claims a pending task by moving it to claimed/. Returns the path of the claimed
+    task, or None if there are no pending tasks.
+    """
+    # Start from a different shard in each worker to reduce contention
+    start = int(hashlib.sha1(worker.encode()).hexdigest(), 16) % N_SHARDS
+    for i in range(N_SHARDS):
+        shard_name = "{:02d}".format((start + i) % N_SHARDS)
+        shard_dir = os.path.join(queue_dir, "pending", shard_name)
+        for entry in sorted(os.listdir(shard_dir)):
+            path = os.path.join(
+                queue_dir,
+                "claimed",
+                shard_name,
+                claimed_name(entry[:-5], time.time() + lease, worker),
+            )
+            try:
+                os.rename(os.path.join(shard_dir, entry), path)
+            except FileNotFoundError:
+                # Another worker claimed it first
+                continue
+            return path
+
+    return None
+
+
+def renew(path, lease):
+    """Extends the lease of a claimed task. Returns the new path, or None if lost."""
+    name, _, worker = parse_claimed_name(os.path.basename(path))
+    new_path = os.path.join(
+        os.path.dirname(path), claimed_name(name, time.time() + lease, worker)
+    )
+    try:
+        os.rename(path, new_path)
+    except FileNotFoundError:
+        return None
+    return new_path
+
+
+def release(queue_dir, path, state, error=None, count_attempt=True):
+    """
+    Moves a claimed task to `state`. The claimed file is first moved out of
+    claimed/, so the task is not released twice if the lease was lost meanwhile.
+    """
+    name = parse_claimed_name(os.path.basename(path))[0] + ".json"
+    tmp_path = os.path.join(queue_dir, "tmp", os.path.basename(path))
+    try:
+        os.rename(path, tmp_path)
+    except FileNotFoundError:
+        print("Lease of {} was lost, another worker will run it".format(name))
+        return
+
+    with open(tmp_path) as f:
+        task = json.load(f)
+    if error is not None:
+        task["errors"].append(error)
+    if count_attempt and state != "done":
+        task["attempts"] += 1
+        if task["attempts"] >= task["max_attempts"]:
+            state = "failed"
+    write_task(queue_dir, task_path(queue_dir, state, name), task)
+    os.remove(tmp_path)
+
+
+def requeue_expired(queue_dir):
+    """Puts back in the queue the claimed tasks whose lease has expired."""
+    now = time.time()
+    for shard_name in os.listdir(os.path.join(queue_dir, "claimed")):
+        shard_dir = os.path.join(queue_dir, "claimed", shard_name)
+        for filename in os.listdir(shard_dir):
+            name, expiry, worker = parse_claimed_name(filename)
+            if expiry < now:
+                print("Lease of {} by {} expired".format(name, worker))
+                release(
+                    queue_dir,
+                    os.path.join(shard_dir, filename),
+                    "pending",
+                    error="lease expired ({})".format(worker),
+                )
+
+
+def is_produced(queue_dir, paths):
+    """Whether a pending or claimed task has any of the paths among its outputs."""
+    for state in ["pending", "claimed"]:
+        for shard_name in os.listdir(os.path.join(queue_dir, state)):
+            shard_dir = os.path.join(queue_dir, state, shard_name)
+            for filename in os.listdir(shard_dir):
+                try:
+                    with open(os.path.join(shard_dir, filename)) as f:
+                        task = json.load(f)
+                except FileNotFoundError:
+                    # Claimed or released meanwhile
+                    continue
+                outputs = HANDLERS[task["kind"]][1](task["settings"])
+                if any(os.path.normpath(path) in outputs for path in paths):
+                    return True
+    return False
+
+
+def run_worker(queue_dir, worker=None, lease=600, poll=30, exit_when_empty=True):
+    """
+    Claims and runs tasks until the queue is empty (or forever, polling every `poll`
+    seconds, if exit_when_empty is False). Tasks whose outputs already exist are
+    marked as done without running them. A task that is not ready is put back in the
+    queue if a pending or claimed task produces its missing inputs, and fails
+    otherwise, as it would wait forever.
+    """
+    if worker is None:
+        worker = "{}-{}".format(socket.gethostname(), os.getpid())
+    create_queue(queue_dir)
+
+    while True:
+        requeue_expired(queue_dir)
+        path = claim(queue_dir, worker, lease)
+        if path is None:
+            if exit_when_empty:
+                break
+            time.sleep(poll)
+            continue
+
+        with open(path) as f:
+            task = json.load(f)
+        kind, settings = task["kind"], task["settings"]
+        handler, outputs = HANDLERS[kind]
+
+        if all(os.path.exists(output) for output in outputs(settings)):
+            print("Skipping {} {}: outputs exist".format(kind, settings))
+            release(queue_dir, path, "done")
+            continue
+
+        # Renew the lease in the background while the task runs
+        claimed = {"path": path}
+        finished = threading.Event()
+
+        def keep_lease():
+            while not finished.wait(lease / 3) and claimed["path"] is not None:
+                claimed["path"] = renew(claimed["path"], lease)
+
+        renewer = threading.Thread(target=keep_lease, daemon=True)
+        renewer.start()
+
+        print("Running {} {}".format(kind, settings))
+        try:
+            handler(settings)
+            state, error, count_attempt = "done", None, False
+        except TaskNotReady as e:
+            state, error, count_attempt = "pending", None, False
+            print("Not ready: {}".format(e))
+            missing = [path for path in e.missing if not os.path.exists(path)]
+            if missing and not is_produced(queue_dir, missing):
+                state = "failed"
+                error = "{}, and no task in the queue produces it".format(e)
+                print("Failing {} {}: {}".format(kind, settings, error))
+        except Exception:
+            state, error, count_attempt = "pending", traceback.format_exc(), True
+            print(error)
+
+        finished.set()
+        renewer.join()
+        if claimed["path"] is not None:
+            release(queue_dir, claimed["path"], state, error, count_attempt)
+        if state == "pending" and error is None:
+            # Give the tasks this one depends on time to finish
+            time.sleep(poll)
+
+
+def status(queue_dir):
+    """Returns the number of tasks in each state."""
+    counts = {}
+    for state in STATES:
+        state_dir = os.path.join(queue_dir, state)
+        if state in ["pending", "claimed"]:
+            counts[state] = sum(
+                len(os.listdir(os.path.join(state_dir, shard_name)))
+                for shard_name in os.listdir(state_dir)
+            )
+        else:
+            counts[state] = len(os.listdir(state_dir))
+    return counts
+
+
+#
+# Tasks
+#
+# Each kind of task is defined by a function that runs it from its settings and a
+# function that returns the files it produces.
+#
+
+
+def model_description(settings):
+    return {
+        "name": settings["model"] + "_SR",
+        "SEI": settings["SEI"],
+        "plating": settings["plating"],
+        "porosity": settings["porosity"],
+    }
+
+
+def cycling_outputs(settings):
+    filename = create_filename(
+        model_description(settings), settings["C_dch"], settings["C_ch"]
+    )
+    sim_filename = os.path.join(
+        "data", "sim_" + filename + "_{}.pkl".format(settings["N_cycles"])
+    )
+    return [sim_filename, sim_filename + ".json"]
+
+
+def run_cycling_task(settings):
+    import pybamm
+    from auxiliary_functions import create_model_options, run_cycling, set_parameters
+    from cycle_summary import add_porosity_summary_variables
+
+    options = create_model_options(settings)
+    model = getattr(pybamm.lithium_ion, settings["model"])(
+        name=settings["model"] + "+SR", options=options
+    )
+    add_porosity_summary_variables(model)
+    run_cycling(
+        model,
+        set_parameters(),
+        settings["C_dch"],
+        settings["C_ch"],
+        settings["N_cycles"],
+        options=options,
+    )
+
+
+def RPT_outputs(settings):
+    filename = create_filename(
+        model_description(settings), settings["C_dch"], settings["C_ch"]
+    )
+    RPT_filename = os.path.join(
+        "data",
+        "RPT_"
+        + create_C_tag(settings["C_RPT"])
+        + "_"
+        + filename
+        + "_{}.csv".format(settings["N_cycles"]),
+    )
+    # The RPT file is written as the RPTs are completed, so the metadata (written at
+    # the end) is what shows that the task finished
+    return [RPT_filename, RPT_filename + ".json"]
+
+
+def run_RPT_task(settings):
+    import pybamm
+    from auxiliary_functions import parameter_fingerprint, run_RPT, write_metadata
+
+    sim_filename = cycling_outputs(settings)[0]
+    if not os.path.exists(sim_filename):
+        raise TaskNotReady(
+            "{} does not exist".format(sim_filename), missing=[sim_filename]
+        )
+
+    sim = pybamm.load_sim(sim_filename)
+    RPT_filename = RPT_outputs(settings)[0]
+    # Resume, so a retried task does not repeat the RPTs already completed
+    run_RPT(
+        sim,
+        C_rate=settings["C_RPT"],
+        RPT_at_cycles=settings.get("RPT_at_cycles", 10),
+        lean=settings.get("lean", True),
+        filename=RPT_filename,
+        resume=True,
+    )
+    write_metadata(
+        RPT_filename,
+        model=sim.model.name,
+        options={key: settings[key] for key in ["SEI", "plating", "porosity"]},
+        C_dch=settings["C_dch"],
+        C_ch=settings["C_ch"],
+        N_cycles=settings["N_cycles"],
+        C_RPT=settings["C_RPT"],
+        RPT_at_cycles=settings.get("RPT_at_cycles", 10),
+        var_pts=sim.var_pts,
+        parameters=parameter_fingerprint(sim.parameter_values),
+    )
+
+
+def figure_outputs(settings):
+    return [os.path.join("figures", settings["filename"])]
+
+
+def run_figure_task(settings):
+    """Runs one of the plotting functions of make_figures.py and saves the figure."""
+    import make_figures
+
+    missing = [
+        os.path.join("data", filename)
+        for filename in settings.get("requires", [])
+        if not os.path.exists(os.path.join("data", filename))
+    ]
+    if missing:
+        raise TaskNotReady("missing {}".format(", ".join(missing)), missing=missing)
+
+    function = getattr(make_figures, settings["function"])
+    fig, _ = function(**settings.get("kwargs", {}))
+    make_figures.save_figure(fig, settings["filename"])
+
+
+HANDLERS = {
+    "cycling": (run_cycling_task, cycling_outputs),
+    "RPT": (run_RPT_task, RPT_outputs),
+    "figure": (run_figure_task, figure_outputs),
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Job queue on a shared filesystem")
+    parser.add_argument("--queue", default="queue", help="shared queue directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    submit_parser = subparsers.add_parser("submit", help="add a task to the queue")
+    submit_parser.add_argument("kind", choices=list(HANDLERS))
+    submit_parser.add_argument(
+        "settings",
+        nargs="*",
+        help="settings of the form key=value, e.g. model=SPMe SEI=true C_dch=1C",
+    )
+    submit_parser.add_argument("--max-attempts", type=int, default=3)
+
+    worker_parser = subparsers.add_parser("worker", help="run tasks from the queue")
+    worker_parser.add_argument("--lease", type=float, default=600)
+    worker_parser.add_argument("--poll", type=float, default=30)
+    worker_parser.add_argument(
+        "--wait",
+        action="store_true",
+        help="keep polling for new tasks when the queue is empty",
+    )
+
+    subparsers.add_parser("status", help="number of tasks in each state")
+    args = parser.parse_args()
+
+    if args.command == "submit":
+        settings = {}
+        for setting in args.settings:
+            key, value = setting.split("=", 1)
+            settings[key] = parse_value(value)
+        print(submit(args.queue, args.kind, settings, args.max_attempts))
+    elif args.command == "worker":
+        run_worker(
+            args.queue, lease=args.lease, poll=args.poll, exit_when_empty=not args.wait
+        )
+    elif args.command == "status":
+        if not os.path.isdir(args.queue):
+            sys.exit("No queue in {}".format(args.queue))
+        print(status(args.queue))
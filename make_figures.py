@@ -10,8 +10,12 @@ from auxiliary_functions import (
     set_plotting_format,
     create_C_tag,
     create_filename,
-    run_cycle,
+    run_cycles,
+    get_cycle_operating_conditions,
     create_model_tag,
+    get_profiles_at_cycles,
+    plot_downsampled,
+    rasterize_dense_axes,
 )
 
 # Define plotting format
@@ -49,7 +53,8 @@ def plot_capacity_single_plot(options, N_cycles=1000):
 
             Q0 = DFN.solution.summary_variables["Capacity [A.h]"][0]
 
-            axes[j, i].plot(
+            plot_downsampled(
+                axes[j, i],
                 DFN.solution.summary_variables["Cycle number"][:],
                 DFN.solution.summary_variables["Capacity [A.h]"][:],
                 label="DFN+SR",
@@ -58,7 +63,8 @@ def plot_capacity_single_plot(options, N_cycles=1000):
                 linewidth=0.75,
             )
 
-            axes[j, i].plot(
+            plot_downsampled(
+                axes[j, i],
                 SPMe.solution.summary_variables["Cycle number"][:],
                 SPMe.solution.summary_variables["Capacity [A.h]"][:],
                 label="SPMe+SR - theor.",
@@ -96,7 +102,8 @@ def plot_capacity_single_plot(options, N_cycles=1000):
                     )
                 )
 
-                axes[j, i].plot(
+                plot_downsampled(
+                    axes[j, i],
                     DFN["Cycle number"],
                     DFN["Discharge capacity [A.h]"],
                     label=None,
@@ -105,7 +112,8 @@ def plot_capacity_single_plot(options, N_cycles=1000):
                     linewidth=0.75,
                 )
 
-                axes[j, i].plot(
+                plot_downsampled(
+                    axes[j, i],
                     SPMe["Cycle number"],
                     SPMe["Discharge capacity [A.h]"],
                     label="SPMe+SR - RPT " + create_C_tag(C_rate, True),
@@ -210,7 +218,14 @@ def plot_porosity_single_plot(options, N_cycles=1000, plot_at_cycles=None):
                     color = None
                     linewidth = None
 
-                for cycle in cycle_list:
+                x, porosities = get_profiles_at_cycles(
+                    sim.solution,
+                    "Negative electrode porosity",
+                    "x_n [m]",
+                    cycles=cycle_list,
+                )
+
+                for cycle, porosity in zip(cycle_list, porosities):
                     if cycle == cycle_list[0]:
                         if sim.model.name[:3] == "DFN":
                             label = "DFN+SR"
@@ -219,11 +234,8 @@ def plot_porosity_single_plot(options, N_cycles=1000, plot_at_cycles=None):
                     else:
                         label = None
 
-                    sol = sim.solution.all_first_states[cycle]
-                    porosity = sol["Negative electrode porosity"].entries
-                    x = sol["x_n [m]"].entries
-
-                    ax.plot(
+                    plot_downsampled(
+                        ax,
                         x,
                         porosity,
                         label=label,
@@ -317,7 +329,21 @@ def plot_voltage_single_plot(options, N_cycles=1000, plot_at_cycles=None):
             else:
                 cycle_list = plot_at_cycles
 
-            for cycle in cycle_list:
+            solutions = {}
+            for sim in sims:
+                print("{}: run cycles {}".format(sim.model.name[:3], cycle_list))
+                experiments = [
+                    pybamm.Experiment(
+                        [
+                            get_cycle_operating_conditions(sim.experiment, cycle)[0]
+                            + " (30 second period)"
+                        ]
+                    )
+                    for cycle in cycle_list
+                ]
+                solutions[sim] = run_cycles(sim, cycle_list, experiment=experiments)
+
+            for k, cycle in enumerate(cycle_list):
                 for sim in sims:
                     if sim.model.name[:3] == "DFN":
                         linestyle = "-"
@@ -333,17 +359,11 @@ def plot_voltage_single_plot(options, N_cycles=1000, plot_at_cycles=None):
                         linewidth = None
                         label = "SPMe+SR - Cycle {}".format(cycle + 1)
 
-                    print("{}: run cycle {}".format(sim.model.name[:3], cycle))
-                    experiment = pybamm.Experiment(
-                        [
-                            sim.experiment.operating_conditions_cycles[cycle][0]
-                            + " (30 second period)"
-                        ]
-                    )
-                    sim_cycle = run_cycle(sim, cycle, experiment=experiment)
-                    ax.plot(
-                        sim_cycle.solution["Discharge capacity [A.h]"].entries,
-                        sim_cycle.solution["Terminal voltage [V]"].entries,
+                    solution = solutions[sim][k]
+                    plot_downsampled(
+                        ax,
+                        solution["Discharge capacity [A.h]"].entries,
+                        solution["Terminal voltage [V]"].entries,
                         linestyle=linestyle,
                         color=color,
                         linewidth=linewidth,
@@ -423,7 +443,8 @@ def plot_capacity_across_models(C_dch=1, C_ch=0.5, N_cycles=1000):
 
         Q0 = DFN.solution.summary_variables["Capacity [A.h]"][0]
 
-        ax.plot(
+        plot_downsampled(
+            ax,
             DFN.solution.summary_variables["Cycle number"][:],
             DFN.solution.summary_variables["Capacity [A.h]"][:],
             label="DFN+SR",
@@ -432,7 +453,8 @@ def plot_capacity_across_models(C_dch=1, C_ch=0.5, N_cycles=1000):
             linewidth=0.75,
         )
 
-        ax.plot(
+        plot_downsampled(
+            ax,
             SPMe.solution.summary_variables["Cycle number"][:],
             SPMe.solution.summary_variables["Capacity [A.h]"][:],
             label="SPMe+SR - theor.",
@@ -470,7 +492,8 @@ def plot_capacity_across_models(C_dch=1, C_ch=0.5, N_cycles=1000):
                 )
             )
 
-            ax.plot(
+            plot_downsampled(
+                ax,
                 DFN["Cycle number"],
                 DFN["Discharge capacity [A.h]"],
                 label=None,
@@ -484,7 +507,8 @@ def plot_capacity_across_models(C_dch=1, C_ch=0.5, N_cycles=1000):
             else:
                 label = "SPMe+SR - RPT " + create_C_tag(C_rate, True)
 
-            ax.plot(
+            plot_downsampled(
+                ax,
                 SPMe["Cycle number"],
                 SPMe["Discharge capacity [A.h]"],
                 label=label,
@@ -581,7 +605,14 @@ def plot_porosity_across_models(C_dch=1, C_ch=0.5, N_cycles=1000, plot_at_cycles
                 color = None
                 linewidth = None
 
-            for cycle in cycle_list:
+            x, porosities = get_profiles_at_cycles(
+                sim.solution,
+                "Negative electrode porosity",
+                "x_n [m]",
+                cycles=cycle_list,
+            )
+
+            for cycle, porosity in zip(cycle_list, porosities):
                 if cycle == cycle_list[0]:
                     if sim.model.name[:3] == "DFN":
                         label = "DFN+SR"
@@ -590,11 +621,8 @@ def plot_porosity_across_models(C_dch=1, C_ch=0.5, N_cycles=1000, plot_at_cycles
                 else:
                     label = None
 
-                sol = sim.solution.all_first_states[cycle]
-                porosity = sol["Negative electrode porosity"].entries
-                x = sol["x_n [m]"].entries
-
-                ax.plot(
+                plot_downsampled(
+                    ax,
                     x,
                     porosity,
                     label=label,
@@ -692,7 +720,19 @@ def plot_voltage_across_models(C_dch=1, C_ch=0.5, N_cycles=1000, plot_at_cycles=
                 color = None
                 linewidth = None
 
-            for cycle, cycle_tag in zip(cycle_list, cycle_tags):
+            print("{}: run cycles {}".format(sim.model.name[:3], cycle_list))
+            experiments = [
+                pybamm.Experiment(
+                    [
+                        get_cycle_operating_conditions(sim.experiment, cycle)[0]
+                        + " (30 second period)"
+                    ]
+                )
+                for cycle in cycle_list
+            ]
+            solutions = run_cycles(sim, cycle_list, experiment=experiments)
+
+            for cycle, cycle_tag, solution in zip(cycle_list, cycle_tags, solutions):
                 if sim.model.name[:3] == "DFN":
                     linestyle = "-"
                     color = "black"
@@ -707,18 +747,11 @@ def plot_voltage_across_models(C_dch=1, C_ch=0.5, N_cycles=1000, plot_at_cycles=
                     linewidth = None
                     label = "SPMe+SR - " + cycle_tag
 
-                print("{}: run cycle {}".format(sim.model.name[:3], cycle))
-                experiment = pybamm.Experiment(
-                    [
-                        sim.experiment.operating_conditions_cycles[cycle][0]
-                        + " (30 second period)"
-                    ]
-                )
-                sim_cycle = run_cycle(sim, cycle, experiment=experiment)
-                Q0 = sim_cycle.solution["Discharge capacity [A.h]"].entries[0]
-                ax.plot(
-                    sim_cycle.solution["Discharge capacity [A.h]"].entries - Q0,
-                    sim_cycle.solution["Terminal voltage [V]"].entries,
+                Q0 = solution["Discharge capacity [A.h]"].entries[0]
+                plot_downsampled(
+                    ax,
+                    solution["Discharge capacity [A.h]"].entries - Q0,
+                    solution["Terminal voltage [V]"].entries,
                     linestyle=linestyle,
                     color=color,
                     linewidth=linewidth,
@@ -755,8 +788,14 @@ def plot_voltage_across_models(C_dch=1, C_ch=0.5, N_cycles=1000, plot_at_cycles=
     return fig, axes
 
 
+def save_figure(fig, filename):
+    rasterize_dense_axes(fig)
+    fig.savefig(os.path.join("figures", filename), dpi=300)
+
+
 if __name__ == "__main__":
     N_cycles = 1000
+    figure_format = "png"  # or "pdf", where the dense curves are rasterised
     C_chs = [1 / 3, 1 / 2]
     C_dchs = [1, 2]
 
@@ -767,49 +806,25 @@ if __name__ == "__main__":
     ]
 
     [fig, ax] = plot_capacity_across_models()
-    fig.savefig(
-        os.path.join("figures", "compare_capacity.png"),
-        dpi=300,
-    )
+    save_figure(fig, "compare_capacity." + figure_format)
 
     [fig, ax] = plot_porosity_across_models()
-    fig.savefig(
-        os.path.join("figures", "compare_porosity.png"),
-        dpi=300,
-    )
+    save_figure(fig, "compare_porosity." + figure_format)
 
     [fig, ax] = plot_voltage_across_models()
-    fig.savefig(
-        os.path.join("figures", "compare_voltage.png"),
-        dpi=300,
-    )
+    save_figure(fig, "compare_voltage." + figure_format)
 
     for options in options_list:
         _, submodel_tag = create_model_tag({"name": "SPMe_SR", **options})
+        tag = submodel_tag + "_{}.{}".format(N_cycles, figure_format)
+
         fig, axes = plot_capacity_single_plot(options)
-        fig.savefig(
-            os.path.join(
-                "figures",
-                "compare_capacity" + submodel_tag + "_{}.png".format(N_cycles),
-            ),
-            dpi=300,
-        )
+        save_figure(fig, "compare_capacity" + tag)
 
         fig, axes = plot_porosity_single_plot(options, plot_at_cycles=100)
-        fig.savefig(
-            os.path.join(
-                "figures",
-                "compare_porosity" + submodel_tag + "_{}.png".format(N_cycles),
-            ),
-            dpi=300,
-        )
+        save_figure(fig, "compare_porosity" + tag)
 
         fig, axes = plot_voltage_single_plot(options)
-        fig.savefig(
-            os.path.join(
-                "figures", "compare_voltage" + submodel_tag + "_{}.png".format(N_cycles)
-            ),
-            dpi=300,
-        )
+        save_figure(fig, "compare_voltage" + tag)
 
     # plt.show()
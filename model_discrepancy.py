@@ -0,0 +1,214 @@
+#
+# Discrepancy between SPMe+SR and DFN+SR across all the scenarios in data/
+#
+# For each scenario simulated with both models, computes the RMSE and the maximum
+# error of SPMe+SR against DFN+SR for
+#   - the theoretical capacity of every cycle (summary files)
+#   - the RPT capacities (RPT files)
+#   - the negative electrode porosity profiles at the start of every cycle
+#   - the voltage curves of the discharge of every cycle (voltage files, written while
+#     cycling by cycle_summary.DischargeCurveWriter)
+# The porosity profiles are read from the porosity files (or, for simulations run
+# before those were written, computed once and cached by browse_results.py). The
+# curves of each quantity are interpolated onto common grids with a single call for
+# all the cycles, and the results are printed as one table and written to
+# data/model_discrepancy.csv.
+#
+
+import os
+import csv
+import numpy as np
+from browse_results import list_scenarios, mtime, porosity_profiles, read_curves
+from catalog import TAGS
+from auxiliary_functions import create_C_tag
+
+# Change settings here
+model = "SPMe_SR"
+reference = "DFN_SR"
+N_grid = 200  # points of the common grid of each voltage curve
+output_filename = os.path.join("data", "model_discrepancy.csv")
+
+QUANTITIES = [
+    # quantity, unit, scale from the units of the data
+    ("Capacity", "mA.h", 1e3),
+    ("RPT capacity", "mA.h", 1e3),
+    ("Porosity", "-", 1),
+    ("Voltage", "mV", 1e3),
+]
+
+
+def errors(difference):
+    """Returns the RMSE and the maximum absolute value of the differences."""
+    difference = np.asarray(difference)
+    if difference.size == 0:
+        return np.nan, np.nan
+    return np.sqrt(np.mean(difference**2)), np.max(np.abs(difference))
+
+
+def interp_rows(x, xp, fp):
+    """
+    Interpolates all the rows of `fp`, given at the points `xp`, onto the points `x`
+    at once. Outside `xp` the first and last values are used, as in `np.interp`.
+    """
+    xp = np.asarray(xp)
+    i = np.clip(np.searchsorted(xp, x), 1, len(xp) - 1)
+    w = np.clip((x - xp[i - 1]) / (xp[i] - xp[i - 1]), 0, 1)
+    return fp[:, i - 1] * (1 - w) + fp[:, i] * w
+
+
+def interp_curves(x, curves):
+    """
+    Interpolates each curve `(xp, fp)` of `curves` onto the corresponding row of `x`
+    with a single call to `np.interp`. The curves are shifted along x so that they
+    do not overlap, and the points are clipped to the range of their curve.
+    """
+    x = np.asarray(x, dtype=float)
+    if not curves:
+        return np.empty_like(x)
+    lower = np.array([xp[0] for xp, _ in curves])
+    upper = np.array([xp[-1] for xp, _ in curves])
+    shift = np.arange(len(curves)) * (np.max(upper - lower) + 1) - lower
+    xp = np.concatenate([curve[0] + s for curve, s in zip(curves, shift)])
+    fp = np.concatenate([curve[1] for curve in curves])
+    x = np.clip(x, lower[:, np.newaxis], upper[:, np.newaxis]) + shift[:, np.newaxis]
+    return np.interp(x, xp, fp)
+
+
+def read_columns(filename, *columns):
+    import pandas as pd
+
+    data = pd.read_csv(os.path.join("data", filename), usecols=columns).dropna()
+    return [data[column].to_numpy() for column in columns]
+
+
+def common_cycles(cycles, values, ref_cycles, ref_values):
+    """Returns the differences of two per-cycle quantities at their common cycles."""
+    _, i, j = np.intersect1d(cycles, ref_cycles, return_indices=True)
+    return values[i] - ref_values[j]
+
+
+def capacity_differences(files, ref_files):
+    if "summary" not in files or "summary" not in ref_files:
+        return []
+    columns = ["Cycle number", "Capacity [A.h]"]
+    return common_cycles(
+        *read_columns(files["summary"][0], *columns),
+        *read_columns(ref_files["summary"][0], *columns)
+    )
+
+
+def RPT_capacity_differences(files, ref_files):
+    # The RPT files of both models are matched by their C-rate tag
+    columns = ["Cycle number", "Discharge capacity [A.h]"]
+    ref_RPTs = {name.split("_")[1]: name for name in ref_files.get("RPT", [])}
+    differences = [
+        common_cycles(
+            *read_columns(name, *columns),
+            *read_columns(ref_RPTs[name.split("_")[1]], *columns)
+        )
+        for name in files.get("RPT", [])
+        if name.split("_")[1] in ref_RPTs
+    ]
+    return np.concatenate(differences) if differences else []
+
+
+def porosity_differences(scenario, files, ref_scenario, ref_files):
+    sources = {"porosity", "sim"}
+    if not (sources & files.keys() and sources & ref_files.keys()):
+        return []
+    profiles = porosity_profiles(scenario, files)
+    ref_profiles = porosity_profiles(ref_scenario, ref_files)
+    N = min(len(profiles["porosity"]), len(ref_profiles["porosity"]))
+    values = profiles["porosity"][:N]
+    if not np.array_equal(profiles["x"], ref_profiles["x"]):
+        values = interp_rows(ref_profiles["x"], profiles["x"], values)
+    return values - ref_profiles["porosity"][:N]
+
+
+def voltage_differences(files, ref_files):
+    if "voltage" not in files or "voltage" not in ref_files:
+        return []
+    filename, ref_filename = files["voltage"][0], ref_files["voltage"][0]
+    cycles, curves = read_curves(filename, mtime(filename))
+    ref_cycles, ref_curves = read_curves(ref_filename, mtime(ref_filename))
+    _, i, j = np.intersect1d(cycles, ref_cycles, return_indices=True)
+    curves = [curves[k] for k in i]
+    ref_curves = [ref_curves[k] for k in j]
+    # Compare the curves up to the smallest of the two discharge capacities
+    Q_max = np.minimum([Q[-1] for Q, _ in curves], [Q[-1] for Q, _ in ref_curves])
+    Q = Q_max[:, np.newaxis] * np.linspace(0, 1, N_grid)
+    return interp_curves(Q, curves) - interp_curves(Q, ref_curves)
+
+
+def label(record):
+    tags = [tag for tag in TAGS if record[tag]]
+    C_rates = [
+        C if isinstance(C, str) else create_C_tag(C)
+        for C in [record["C_dch"], record["C_ch"]]
+    ]
+    return "{}, {} dch, {} ch, {} cycles".format(
+        " + ".join(tags) or "no degradation", *C_rates, record["N_cycles"]
+    )
+
+
+def compute_discrepancies():
+    """
+    Returns the errors of the model against the reference for all the scenarios
+    simulated with both, as a list of dictionaries.
+    """
+    scenarios = list_scenarios()
+    rows = []
+    for scenario, record in sorted(scenarios.items()):
+        if record["model"] != model:
+            continue
+        ref_scenario = reference + scenario[len(model) :]
+        if ref_scenario not in scenarios:
+            continue
+        files = record["files"]
+        ref_files = scenarios[ref_scenario]["files"]
+
+        differences = [
+            capacity_differences(files, ref_files),
+            RPT_capacity_differences(files, ref_files),
+            porosity_differences(scenario, files, ref_scenario, ref_files),
+            voltage_differences(files, ref_files),
+        ]
+        row = {"Scenario": label(record)}
+        for (quantity, unit, scale), difference in zip(QUANTITIES, differences):
+            rmse, max_error = errors(difference)
+            row["{} RMSE [{}]".format(quantity, unit)] = scale * rmse
+            row["{} max [{}]".format(quantity, unit)] = scale * max_error
+        rows.append(row)
+    return rows
+
+
+if __name__ == "__main__":
+    import time
+    from prettytable import PrettyTable
+
+    start = time.perf_counter()
+    rows = compute_discrepancies()
+    if not rows:
+        raise SystemExit(
+            "No scenarios simulated with both {} and {} in data/".format(
+                model, reference
+            )
+        )
+
+    columns = list(rows[0])
+    table = PrettyTable(columns)
+    table.align["Scenario"] = "l"
+    for row in rows:
+        table.add_row(
+            [row["Scenario"]] + ["{:.3g}".format(row[column]) for column in columns[1:]]
+        )
+    print("{} against {}".format(model, reference))
+    print(table)
+
+    with open(output_filename, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(
+        "Written to {} in {:.2f} s".format(output_filename, time.perf_counter() - start)
+    )
@@ -0,0 +1,152 @@
+#
+# Sampling profiler to find where the time of the cycling and RPT scripts goes
+#
+# A timer signal interrupts the main thread every `interval` seconds and the current
+# Python stack is recorded, weighted by the time elapsed since the previous sample.
+# Signals are only handled between Python bytecodes, so the time spent in a native
+# call (e.g. the CasADi integrator) is attributed to the Python line that made the
+# call, once the call returns. Only available in Linux and MacOS.
+#
+
+import os
+import signal
+import time
+from collections import Counter, defaultdict
+
+# Categories of the stacks, checked from the innermost frame outwards. Each category
+# is given by the functions (and the file they are defined in) that identify it.
+CATEGORIES = [
+    ("solver (native)", "casadi_solver.py", ["_run_integrator", "_solve_for_event"]),
+    ("solver (native)", "idaklu_solver.py", ["_integrate"]),
+    ("solver (native)", "scikits_dae_solver.py", ["_integrate"]),
+    ("solver (native)", "scikits_ode_solver.py", ["_integrate"]),
+    (
+        "event checking",
+        "base_solver.py",
+        [
+            "get_termination_reason",
+            "check_extrapolation",
+            "_check_events_with_initial_conditions",
+        ],
+    ),
+    (
+        "step initialisation",
+        "base_solver.py",
+        ["set_up", "_set_initial_conditions", "calculate_consistent_state"],
+    ),
+    ("step initialisation", "base_model.py", ["set_initial_conditions_from"]),
+    ("solution concatenation", "solution.py", ["__add__", "copy"]),
+    (
+        "cycle bookkeeping",
+        "solution.py",
+        ["make_cycle_solution", "first_state", "last_state", "set_summary_variables"],
+    ),
+    ("variable evaluation", "processed_variable.py", []),
+    ("model building", "simulation.py", ["build", "build_for_experiment"]),
+    ("step switching", "simulation.py", ["solve"]),
+]
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler of the main thread. Use :meth:`start` and :meth:`stop` around
+    the code to profile, then :meth:`report` to print the cost per category and per
+    function and save the stacks in the folded format used by flame graph tools
+    (e.g. flamegraph.pl or speedscope).
+
+    Parameters
+    ----------
+    interval : float, optional
+        The sampling interval in seconds. Default is 5 ms.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+
+    def start(self):
+        self.last_sample = time.perf_counter()
+        signal.signal(signal.SIGALRM, self.sample)
+        signal.setitimer(signal.ITIMER_REAL, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, signal.SIG_DFL)
+
+    def sample(self, signum, frame):
+        now = time.perf_counter()
+        elapsed = now - self.last_sample
+        self.last_sample = now
+
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_name, code.co_firstlineno))
+            frame = frame.f_back
+        self.stacks[tuple(reversed(stack))] += elapsed
+
+    def category(self, stack):
+        for filename, function, _ in reversed(stack):
+            basename = os.path.basename(filename)
+            for name, category_file, functions in CATEGORIES:
+                if basename == category_file and (
+                    not functions or function in functions
+                ):
+                    return name
+        return "other Python"
+
+    def report(self, filename, N_functions=20):
+        """Prints the cost tables and saves the folded stacks to `filename`."""
+        from prettytable import PrettyTable
+
+        total = sum(self.stacks.values())
+        categories = Counter()
+        self_time = Counter()
+        cumulative_time = Counter()
+        for stack, elapsed in self.stacks.items():
+            categories[self.category(stack)] += elapsed
+            frames = [frame_label(frame) for frame in stack]
+            self_time[frames[-1]] += elapsed
+            for frame in set(frames):
+                cumulative_time[frame] += elapsed
+
+        table = PrettyTable(["Category", "Time [s]", "Share [%]"])
+        for name, elapsed in categories.most_common():
+            table.add_row(
+                [name, "{:.2f}".format(elapsed), "{:.1f}".format(100 * elapsed / total)]
+            )
+        print("Profile of {:.2f} s".format(total))
+        print(table)
+
+        table = PrettyTable(["Function", "Self [s]", "Cumulative [s]"])
+        for frame, elapsed in self_time.most_common(N_functions):
+            table.add_row(
+                [
+                    frame,
+                    "{:.2f}".format(elapsed),
+                    "{:.2f}".format(cumulative_time[frame]),
+                ]
+            )
+        print(table)
+
+        # Folded stacks, with the weights in microseconds
+        folded = defaultdict(int)
+        for stack, elapsed in self.stacks.items():
+            folded[";".join(frame_label(frame) for frame in stack)] += int(
+                1e6 * elapsed
+            )
+        with open(filename, "w") as f:
+            for stack, weight in folded.items():
+                f.write("{} {}\n".format(stack, weight))
+
+
+def frame_label(frame):
+    """Label of a frame, e.g. `step (pybamm/solvers/base_solver.py:1067)`."""
+    filename, function, line = frame
+    parts = filename.split(os.sep)
+    if "site-packages" in parts:
+        parts = parts[parts.index("site-packages") + 1 :]
+    else:
+        parts = parts[-1:]
+    # Semicolons separate the frames in the folded format
+    return "{} ({}:{})".format(function, "/".join(parts), line).replace(";", ",")
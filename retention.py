@@ -0,0 +1,185 @@
+#
+# Keep the full solutions of selected cycles within a storage budget
+#
+# A RetentionPolicy can be given as `save_at_cycles` to run_cycling or solve_cycles.
+# As soon as a cycle is completed, the policy decides whether to keep it and, if so,
+# writes its times and states to an npz file in its directory, so at most one cycle
+# is held in memory besides the first one. The strategies are
+#   - "uniform": equally spaced cycles
+#   - "log": log-spaced cycles, with more detail in the first cycles
+#   - "capacity drop": a cycle every time the capacity drops by capacity_drop (as a
+#     fraction of the initial capacity) since the last kept cycle
+# The number of cycles kept by "uniform" and "log" is the budget divided by the size
+# of the first cycle. With "capacity drop", every other kept cycle is deleted and the
+# threshold doubled when the budget is full, so the kept cycles always cover the
+# whole run. The cycles are loaded back with load_cycle.
+#
+
+import os
+import numpy as np
+
+STRATEGIES = ["uniform", "log", "capacity drop"]
+
+
+class RetentionPolicy:
+    """
+    Chooses the cycles whose full solution is kept and spills them to disk.
+
+    Parameters
+    ----------
+    budget : float
+        Disk space for the kept cycles, in MB.
+    strategy : str, optional
+        One of "uniform", "log" (default) or "capacity drop".
+    directory : str, optional
+        Where the cycles are written. :func:`auxiliary_functions.run_cycling` sets it
+        to a directory in data/ named after the simulation if not given.
+    capacity_drop : float, optional
+        Initial capacity drop, as a fraction of the initial capacity, between the
+        kept cycles of the "capacity drop" strategy. Default is 0.005.
+    """
+
+    def __init__(self, budget, strategy="log", directory=None, capacity_drop=0.005):
+        if strategy not in STRATEGIES:
+            raise ValueError(
+                "strategy must be one of {}, not '{}'".format(STRATEGIES, strategy)
+            )
+        self.budget = budget * 1e6
+        self.strategy = strategy
+        self.directory = directory
+        self.capacity_drop = capacity_drop
+
+    def start(self, simulation, N_cycles):
+        """Called by :func:`auxiliary_functions.solve_cycles` before cycling."""
+        if self.directory is None:
+            raise ValueError("The directory of the retention policy is not set")
+        os.makedirs(self.directory, exist_ok=True)
+        self.simulation = simulation
+        self.N_cycles = N_cycles
+        self.sizes = {}
+        self.planned = None
+        self.full = False
+        self.Q0 = None
+        self.Q_last = None
+
+    def retain(self, cycle_number, cycle, summary_variables):
+        """Writes the cycle to disk if the strategy keeps it."""
+        if self.full:
+            return
+        if self.strategy == "capacity drop":
+            self.retain_on_capacity_drop(cycle_number, cycle, summary_variables)
+            return
+
+        if self.planned is not None and cycle_number not in self.planned:
+            return
+        self.write(cycle_number, cycle)
+        if self.planned is None:
+            self.planned = self.plan(self.budget // self.sizes[cycle_number])
+        if sum(self.sizes.values()) > self.budget:
+            # The later cycles turned out larger than the first one
+            self.delete(cycle_number)
+            self.full = True
+
+    def retain_on_capacity_drop(self, cycle_number, cycle, summary_variables):
+        Q = summary_variables["Capacity [A.h]"]
+        if self.Q0 is None:
+            self.Q0 = self.Q_last = Q
+        elif self.Q_last - Q < self.capacity_drop * self.Q0:
+            return
+        self.write(cycle_number, cycle)
+        self.Q_last = Q
+        while sum(self.sizes.values()) > self.budget and len(self.sizes) > 2:
+            # Thin out the kept cycles, always keeping the first and the new one
+            kept = sorted(self.sizes)
+            for number in kept[1:-1:2]:
+                self.delete(number)
+            self.capacity_drop *= 2
+        if sum(self.sizes.values()) > self.budget:
+            self.delete(cycle_number)
+            self.full = True
+
+    def plan(self, N_keep):
+        """Returns the cycles to keep for the "uniform" and "log" strategies."""
+        N_keep = int(min(max(N_keep, 1), self.N_cycles))
+        # Rounding the log-spaced cycles gives duplicates, so add points until there
+        # are N_keep different cycles
+        for N_points in range(N_keep, 100 * self.N_cycles):
+            if self.strategy == "uniform":
+                points = np.linspace(1, self.N_cycles, N_points)
+            else:
+                points = np.geomspace(1, self.N_cycles, N_points)
+            cycles = np.unique(np.round(points).astype(int))
+            if len(cycles) >= N_keep:
+                break
+        return set(cycles.tolist())
+
+    def filename(self, cycle_number):
+        return os.path.join(self.directory, "cycle_{}.npz".format(cycle_number))
+
+    def write(self, cycle_number, cycle):
+        # Each step is made of several sub-solutions (e.g. the windows of the safe
+        # mode of the CasADi solver), so the operating conditions of a step solved
+        # with the model of each sub-solution are stored to find the model back
+        model_steps = {
+            id(model): step
+            for step, model in self.simulation.op_conds_to_built_models.items()
+        }
+        arrays = {
+            "steps": np.array([model_steps[id(model)] for model in cycle.all_models]),
+            "termination": np.array(cycle.termination),
+        }
+        for k, (t, y, inputs) in enumerate(
+            zip(cycle.all_ts, cycle.all_ys, cycle.all_inputs)
+        ):
+            arrays["t_{}".format(k)] = t
+            arrays["y_{}".format(k)] = np.asarray(y)
+            for name, value in inputs.items():
+                arrays["inputs_{}_{}".format(k, name)] = np.asarray(value)
+        np.savez_compressed(self.filename(cycle_number), **arrays)
+        self.sizes[cycle_number] = os.path.getsize(self.filename(cycle_number))
+
+    def delete(self, cycle_number):
+        os.remove(self.filename(cycle_number))
+        del self.sizes[cycle_number]
+
+    @property
+    def retained_cycles(self):
+        return sorted(self.sizes)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("simulation", None)
+        return state
+
+
+def load_cycle(simulation, directory, cycle_number):
+    """
+    Returns the solution of a cycle kept by a :class:`RetentionPolicy`, as a
+    :class:`pybamm.Solution` with the built models of the simulation that solved it.
+    """
+    import pybamm
+
+    filename = os.path.join(directory, "cycle_{}.npz".format(cycle_number))
+    with np.load(filename) as data:
+        # One entry per sub-solution, not per step of the experiment
+        steps = [str(step) for step in data["steps"]]
+        N = len([key for key in data.files if key.startswith("t_")])
+        if N != len(steps):
+            raise ValueError("{} is not a complete cycle".format(filename))
+        all_inputs = []
+        for k in range(N):
+            prefix = "inputs_{}_".format(k)
+            all_inputs.append(
+                {
+                    key[len(prefix) :]: data[key]
+                    for key in data.files
+                    if key.startswith(prefix)
+                }
+            )
+        return pybamm.Solution(
+            [data["t_{}".format(k)] for k in range(N)],
+            [data["y_{}".format(k)] for k in range(N)],
+            [simulation.op_conds_to_built_models[step] for step in steps],
+            all_inputs,
+            termination=str(data["termination"]),
+        )
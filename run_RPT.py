@@ -6,6 +6,8 @@ from auxiliary_functions import (
     run_RPT,
     set_plotting_format,
     create_C_tag,
+    parameter_fingerprint,
+    write_metadata,
 )
 
 # Define plotting format
@@ -18,30 +20,62 @@ C_dch = 1
 options = {"SEI": False, "plating": True, "porosity": True}
 RPT_at_cycles = 10
 sims = ["SPMe_SR", "DFN_SR"]
+mesh = None  # mesh of the simulations, as set in run_experiments.py
 C_rates = [1 / 3]
+lean = True  # only compute what is needed for the capacity
+resume = True  # skip the RPTs already in the output file
+profile = False  # sample where the time goes, see profiler.py
 
 for name in sims:
     sim = pybamm.load_sim(
         os.path.join(
             "data",
             "sim_"
-            + create_filename({"name": name, **options}, C_dch, C_ch)
+            + create_filename({"name": name, **options}, C_dch, C_ch, mesh=mesh)
             + "_{}.pkl".format(N_cycles),
         )
     )
     for C_rate in C_rates:
         print("RPT for {} at {:.2f}C".format(sim.model.name, C_rate))
-        df = run_RPT(sim, C_rate=C_rate, RPT_at_cycles=RPT_at_cycles)
+        RPT_filename = os.path.join(
+            "data",
+            "RPT_"
+            + create_C_tag(C_rate)
+            + "_"
+            + create_filename(sim.model, C_dch, C_ch, mesh=mesh)
+            + "_{}.csv".format(N_cycles),
+        )
+        if profile:
+            from profiler import SamplingProfiler
 
-        df.to_csv(
-            os.path.join(
-                "data",
-                "RPT_"
-                + create_C_tag(C_rate)
-                + "_"
-                + create_filename(sim.model, C_dch, C_ch)
-                + "_{}.csv".format(N_cycles),
+            profiler = SamplingProfiler()
+            profiler.start()
+        run_RPT(
+            sim,
+            C_rate=C_rate,
+            RPT_at_cycles=RPT_at_cycles,
+            lean=lean,
+            filename=RPT_filename,
+            resume=resume,
+        )
+        if profile:
+            profiler.stop()
+            profiler.report(
+                RPT_filename.replace("RPT_", "profile_RPT_", 1).replace(
+                    ".csv", ".folded"
+                )
             )
+        write_metadata(
+            RPT_filename,
+            model=sim.model.name,
+            options=options,
+            C_dch=C_dch,
+            C_ch=C_ch,
+            N_cycles=N_cycles,
+            C_RPT=C_rate,
+            RPT_at_cycles=RPT_at_cycles,
+            var_pts=sim.var_pts,
+            parameters=parameter_fingerprint(sim.parameter_values),
         )
 
         gc.collect()
@@ -0,0 +1,112 @@
+#
+# Run a model with a measured current trace, streamed from disk in chunks
+#
+
+import os
+import gc
+import pybamm
+import pandas as pd
+from auxiliary_functions import (
+    set_parameters,
+    create_model_tag,
+    create_model_options,
+    starting_state,
+    parameter_fingerprint,
+    write_metadata,
+)
+
+pybamm.set_logging_level("NOTICE")
+
+# Change settings here
+trace_filename = os.path.join("data", "traces", "field_trace.csv")
+chunk_size = 100000  # number of samples of the trace solved at once
+output_every = 10  # store one in every output_every samples
+options = {"SEI": True, "plating": True, "porosity": True}
+variables = [
+    "Time [s]",
+    "Current [A]",
+    "Terminal voltage [V]",
+    "Discharge capacity [A.h]",
+    "Loss of lithium inventory [%]",
+    "Loss of capacity to SEI [A.h]",
+    "Loss of capacity to lithium plating [A.h]",
+    "X-averaged negative electrode porosity",
+]
+
+# Define model and parameters
+model = pybamm.lithium_ion.SPMe(name="SPMe+SR", options=create_model_options(options))
+# model = pybamm.lithium_ion.DFN(name="DFN+SR", options=create_model_options(options))
+param = set_parameters()
+
+# The trace is a csv file with two columns, time [s] and current [A], in the same
+# format as the PyBaMM drive cycles (lines starting with # are ignored)
+trace_name = os.path.splitext(os.path.basename(trace_filename))[0]
+model_name, tag = create_model_tag(model)
+filename = os.path.join(
+    "data", "drive_" + model_name.replace("+", "_") + "_" + trace_name + tag + ".csv"
+)
+if os.path.exists(filename):
+    os.remove(filename)
+
+chunks = pd.read_csv(
+    trace_filename, comment="#", header=None, names=["t", "I"], chunksize=chunk_size
+)
+
+# Solve the trace chunk by chunk, starting each chunk from the last state of the
+# previous one. The last sample of each chunk is prepended to the next one so the
+# current is interpolated continuously across chunks.
+solution = None
+previous_sample = None
+for i, chunk in enumerate(chunks):
+    if previous_sample is not None:
+        chunk = pd.concat([previous_sample, chunk])
+    previous_sample = chunk.iloc[-1:]
+    if len(chunk) < 2:
+        break
+
+    data = chunk.to_numpy(dtype=float)
+    data[:, 0] -= data[0, 0]
+    print("Chunk {}: {:.0f} s of trace".format(i + 1, data[-1, 0]))
+
+    experiment = pybamm.Experiment(["Run chunk (A)"], drive_cycles={"chunk": data})
+    sim = pybamm.Simulation(
+        model,
+        experiment=experiment,
+        parameter_values=param,
+        solver=pybamm.CasadiSolver("safe"),
+    )
+    if solution is None:
+        solution = sim.solve(calc_esoh=False)
+    else:
+        solution = sim.solve(
+            starting_solution=starting_state(solution.last_state), calc_esoh=False
+        )
+    chunk_solution = solution.cycles[-1]
+
+    # Skip the first point of later chunks, as it is the last point of the previous
+    df = pd.DataFrame(
+        {var: chunk_solution[var].entries[::output_every] for var in variables}
+    )
+    if i > 0:
+        df = df.iloc[1:]
+    df.to_csv(filename, mode="a", header=(i == 0), index=False)
+
+    termination = chunk_solution.termination
+    solution = solution.last_state
+    del sim, chunk_solution, df
+    gc.collect()
+
+    # Stop if the trace cannot be followed (e.g. the voltage cut-off is reached)
+    if termination != "final time":
+        print("Stopping: {}".format(termination))
+        break
+
+write_metadata(
+    filename,
+    model=model.name,
+    options=options,
+    trace=trace_filename,
+    chunk_size=chunk_size,
+    output_every=output_every,
+    parameters=parameter_fingerprint(param),
+)
@@ -1,6 +1,7 @@
-import os
 import pybamm
-from auxiliary_functions import set_parameters, create_filename
+from auxiliary_functions import set_parameters, run_cycling
+from cycle_summary import add_porosity_summary_variables
+from retention import RetentionPolicy
 
 pybamm.set_logging_level("NOTICE")
 
@@ -18,44 +19,46 @@ DFN = pybamm.lithium_ion.DFN(name="DFN+SR", options=options)
 
 models = [SPMe, DFN]
 
+for model in models:
+    add_porosity_summary_variables(model)
+
 # Define parameters
 param = set_parameters()
 
 # Define experiment
 N_cycles = 1000
 save_at_cycles = [1]  # [1] by default to save memory
+# Disk budget in MB to keep full cycles chosen by a strategy instead, see retention.py
+retention_budget = None
+retention_strategy = "log"  # "uniform", "log" or "capacity drop"
+archive_options = {"encoding": "lossless"}  # None to store the states uncompressed
 C_ch = 1 / 2
 C_dch = 1
-
-experiment = pybamm.Experiment(
-    [
-        (
-            "Discharge at {}C until 2.5 V".format(C_dch),
-            "Charge at {}C until 4.2 V".format(C_ch),
-            "Hold at 4.2 V until C/20",
-        )
-    ]
-    * N_cycles,
-)
+mesh = None  # PyBaMM's default, or e.g. {"Nx": 10, "Nr": 10}, see create_mesh
+profile = False  # sample where the time goes, see profiler.py
 
 # Solve models
-sims = []
-
 for model in models:
-    solver = pybamm.CasadiSolver("safe")
-    sim = pybamm.Simulation(
+    if profile:
+        from profiler import SamplingProfiler
+
+        profiler = SamplingProfiler()
+        profiler.start()
+    if retention_budget is not None:
+        save_at_cycles = RetentionPolicy(retention_budget, retention_strategy)
+    sim_filename = run_cycling(
         model,
-        parameter_values=param,
-        experiment=experiment,
-        solver=solver,
+        param,
+        C_dch,
+        C_ch,
+        N_cycles,
+        save_at_cycles=save_at_cycles,
+        options=options,
+        archive_options=archive_options,
+        mesh=mesh,
     )
-    sim.solve(save_at_cycles=save_at_cycles)
-    filename = create_filename(model, C_dch, C_ch)
-    # Hack to allow pickling
-    # sim.op_conds_to_built_solvers = None
-    sim.save(
-        os.path.join(
-            "data",
-            "sim_" + filename + "_{}.pkl".format(N_cycles),
+    if profile:
+        profiler.stop()
+        profiler.report(
+            sim_filename.replace("sim_", "profile_").replace(".pkl", ".folded")
         )
-    )
@@ -0,0 +1,158 @@
+#
+# Multi-fidelity cycling: run SPMe+SR and promote the flagged cycles to DFN+SR
+#
+
+import os
+import pybamm
+import numpy as np
+import pandas as pd
+from auxiliary_functions import (
+    create_filename,
+    create_model_options,
+    run_cycle,
+)
+
+
+def error_indicators(simulation):
+    """
+    Computes, for each stored cycle of the SPMe+SR simulation, the indicators used to
+    decide whether the cycle needs to be re-run with DFN+SR:
+
+    * the maximum C-rate of the steps of the cycle, as SPMe+SR loses accuracy at high
+      C-rates,
+    * the maximum over the cycle of the relative spread of the electrolyte
+      concentration, which is largest during the discharge,
+    * the relative change in capacity with respect to the previous cycle.
+    """
+    N = len(simulation.solution.all_first_states)
+    experiment = simulation.experiment
+    capacity = simulation.parameter_values["Nominal cell capacity [A.h]"]
+
+    # Maximum C-rate of each cycle (the experiment may define only one period of
+    # cycles, see solve_cycles)
+    C_rates = []
+    starts = np.cumsum([0] + experiment.cycle_lengths)
+    for cycle in range(N):
+        k = cycle % len(experiment.cycle_lengths)
+        C_rate = 0
+        for op_conds in experiment.operating_conditions[starts[k] : starts[k + 1]]:
+            current = op_conds.get("Current input [A]", 0)
+            if isinstance(current, (int, float)):
+                C_rate = max(C_rate, abs(current) / capacity)
+        C_rates.append(C_rate)
+
+    # Electrolyte concentration spread, recorded over each cycle while cycling (at
+    # the start of the cycles the electrolyte has relaxed after the CV hold)
+    summary_variables = simulation.solution.summary_variables
+    c_e_spread = summary_variables["Maximum electrolyte concentration spread"][:N]
+
+    # Capacity change between consecutive cycles
+    Q = summary_variables["Measured capacity [A.h]"][:N]
+    Q_change = np.abs(np.diff(Q, prepend=Q[0])) / Q[0]
+
+    df = pd.DataFrame(
+        data={
+            "Cycle number": np.arange(1, N + 1),
+            "C-rate": C_rates,
+            "Electrolyte concentration spread": c_e_spread,
+            "Relative capacity change": Q_change,
+        }
+    )
+
+    return df
+
+
+def flag_cycles(indicators, thresholds):
+    """
+    Returns the (zero-indexed) cycles for which any of the indicators exceeds its
+    threshold. The thresholds are given as a dictionary with the indicator names as
+    keys.
+    """
+    flagged = np.zeros(len(indicators), dtype=bool)
+    for name, threshold in thresholds.items():
+        flagged |= indicators[name].to_numpy() > threshold
+
+    return list(np.flatnonzero(flagged))
+
+
+def promote_cycles(simulation, cycles, model):
+    """
+    Re-runs the given cycles of a SPMe+SR simulation with a higher fidelity model
+    (e.g. DFN+SR), starting from the SPMe+SR state mapped onto the new model, and
+    compares the measured capacity and minimum voltage of both models.
+    """
+    summary_variables = simulation.solution.summary_variables
+    data = []
+
+    for cycle in cycles:
+        print("{}: run cycle {}".format(model.name, cycle + 1))
+        sim_cycle = run_cycle(simulation, cycle, model=model)
+        promoted_variables = sim_cycle.solution.summary_variables
+
+        data.append(
+            [
+                cycle + 1,
+                summary_variables["Measured capacity [A.h]"][cycle],
+                promoted_variables["Measured capacity [A.h]"][0],
+                summary_variables["Minimum voltage [V]"][cycle],
+                promoted_variables["Minimum voltage [V]"][0],
+            ]
+        )
+
+    df = pd.DataFrame(
+        data,
+        columns=[
+            "Cycle number",
+            "Measured capacity (low fidelity) [A.h]",
+            "Measured capacity (high fidelity) [A.h]",
+            "Minimum voltage (low fidelity) [V]",
+            "Minimum voltage (high fidelity) [V]",
+        ],
+    )
+    df["Capacity error [A.h]"] = (
+        df["Measured capacity (low fidelity) [A.h]"]
+        - df["Measured capacity (high fidelity) [A.h]"]
+    )
+
+    return df
+
+
+if __name__ == "__main__":
+    pybamm.set_logging_level("NOTICE")
+
+    # Define model options
+    N_cycles = 1000
+    C_ch = 1 / 2
+    C_dch = 1
+    options = {"SEI": True, "plating": True, "porosity": True}
+    thresholds = {
+        "C-rate": 1.5,
+        # About 1.6 in the first cycles at 1C, it grows as the porosity decreases
+        "Electrolyte concentration spread": 1.75,
+        "Relative capacity change": 1e-3,
+    }
+
+    # Load the SPMe+SR simulation run by run_experiments.py
+    SPMe = pybamm.load_sim(
+        os.path.join(
+            "data",
+            "sim_"
+            + create_filename({"name": "SPMe_SR", **options}, C_dch, C_ch)
+            + "_{}.pkl".format(N_cycles),
+        )
+    )
+    DFN = pybamm.lithium_ion.DFN(name="DFN+SR", options=create_model_options(options))
+
+    indicators = error_indicators(SPMe)
+    cycles = flag_cycles(indicators, thresholds)
+    print("Promoting {} of {} cycles to DFN+SR".format(len(cycles), len(indicators)))
+
+    df = indicators.merge(promote_cycles(SPMe, cycles, DFN), how="left")
+    df.to_csv(
+        os.path.join(
+            "data",
+            "multifidelity_"
+            + create_filename(SPMe.model, C_dch, C_ch)
+            + "_{}.csv".format(N_cycles),
+        )
+    )
@@ -0,0 +1,193 @@
+#
+# Run the RPTs while the cycling is still in progress
+#
+# The cycling (run with run_cycling, as in run_experiments.py) publishes the state at
+# the start of each RPT cycle to a queue as soon as the cycle is completed, and a
+# pool of RPT workers consume the states and send back the capacities, which are
+# written to the RPT file as they arrive.
+#
+
+import os
+import csv
+import json
+import queue
+import multiprocessing
+import pandas as pd
+from auxiliary_functions import (
+    create_filename,
+    create_C_tag,
+    create_mesh,
+    create_model_options,
+    set_parameters,
+    run_cycling,
+    solve_RPT,
+    RPT_experiment,
+    get_state_variables,
+    write_metadata,
+)
+
+
+def build_model(model_name, options):
+    import pybamm
+    from cycle_summary import add_porosity_summary_variables
+
+    model = getattr(pybamm.lithium_ion, model_name)(
+        name=model_name + "+SR", options=create_model_options(options)
+    )
+    return add_porosity_summary_variables(model)
+
+
+def RPT_worker(states, results, model_name, options, C_RPT, lean, mesh=None):
+    """Runs the RPT from the states in the queue until it receives None."""
+    import pybamm
+
+    model = build_model(model_name, options)
+    param = set_parameters()
+    experiment = RPT_experiment(C_RPT)
+    # The same solver as the cycling, as in run_RPT
+    solver = pybamm.CasadiSolver("safe")
+    # The same mesh as the cycling, as in run_RPT
+    mesh = {} if mesh is None else create_mesh(model, **mesh)
+
+    while True:
+        item = states.get()
+        if item is None:
+            break
+        cycle, state = item
+        try:
+            capacity, termination = solve_RPT(
+                model, state, experiment, param, solver=solver, lean=lean, **mesh
+            )
+        except Exception as e:
+            capacity, termination = float("nan"), "error: {}".format(e)
+        results.put((cycle + 1, capacity, termination))
+
+
+if __name__ == "__main__":
+    import pybamm
+    from retention import RetentionPolicy
+
+    pybamm.set_logging_level("NOTICE")
+
+    # Change settings here
+    model_name = "SPMe"  # or "DFN"
+    options = {"SEI": True, "plating": True, "porosity": True}
+    N_cycles = 1000
+    save_at_cycles = [1]  # [1] by default to save memory
+    # Disk budget in MB to keep full cycles chosen by a strategy instead, see
+    # retention.py
+    retention_budget = None
+    retention_strategy = "log"  # "uniform", "log" or "capacity drop"
+    archive_options = {"encoding": "lossless"}  # None to store the states uncompressed
+    C_ch = 1 / 2
+    C_dch = 1
+    mesh = None  # PyBaMM's default, or e.g. {"Nx": 10, "Nr": 10}, see create_mesh
+    C_RPT = 1 / 3
+    RPT_at_cycles = 10
+    lean = True  # only compute what is needed for the capacity
+    N_workers = 2  # number of RPT worker processes
+    timeout = 10  # seconds between checks that the RPT workers are alive
+
+    model = build_model(model_name, options)
+    param = set_parameters()
+    if retention_budget is not None:
+        save_at_cycles = RetentionPolicy(retention_budget, retention_strategy)
+
+    filename = create_filename(model, C_dch, C_ch, mesh=mesh)
+    RPT_filename = os.path.join(
+        "data",
+        "RPT_" + create_C_tag(C_RPT) + "_" + filename + "_{}.csv".format(N_cycles),
+    )
+
+    # Start the RPT workers
+    states = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(
+            target=RPT_worker,
+            args=(states, results, model_name, options, C_RPT, lean, mesh),
+        )
+        for _ in range(N_workers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    with open(RPT_filename, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Cycle number", "Discharge capacity [A.h]", "Termination"])
+
+        counts = {"published": 0, "written": 0, "crashed": False}
+
+        def write_results(block=False):
+            """
+            Writes the RPTs received. If block is True, waits for all the published
+            RPTs, unless a worker has died. Returns False if a worker has died.
+            """
+            while counts["written"] < counts["published"]:
+                try:
+                    row = results.get(block=block, timeout=timeout)
+                except queue.Empty:
+                    crashed = [
+                        worker.exitcode
+                        for worker in workers
+                        if worker.exitcode not in [None, 0]
+                    ]
+                    if crashed:
+                        print(
+                            "RPT workers exited with codes {}, {} RPTs are missing. "
+                            "Run run_RPT.py with resume = True to complete "
+                            "them".format(
+                                crashed, counts["published"] - counts["written"]
+                            )
+                        )
+                        return False
+                    if not block:
+                        break
+                    continue
+                writer.writerow(row)
+                counts["written"] += 1
+            f.flush()
+            return True
+
+        def publish_state(cycle, first_state):
+            # Carry on cycling without RPTs if a worker has died
+            if counts["crashed"]:
+                return
+            # RPT at the first cycle and every RPT_at_cycles cycles, as run_RPT
+            if cycle == 0 or (cycle + 1) % RPT_at_cycles == 0:
+                states.put((cycle, get_state_variables(model, first_state)))
+                counts["published"] += 1
+            counts["crashed"] = not write_results()
+
+        sim_filename = run_cycling(
+            model,
+            param,
+            C_dch,
+            C_ch,
+            N_cycles,
+            save_at_cycles=save_at_cycles,
+            options=options,
+            archive_options=archive_options,
+            mesh=mesh,
+            on_cycle_end=publish_state,
+        )
+
+        for _ in workers:
+            states.put(None)
+        if not counts["crashed"] and write_results(block=True):
+            for worker in workers:
+                worker.join()
+        else:
+            # The states no worker will read stay buffered in the queue, so do not
+            # wait at exit for them to be sent
+            states.cancel_join_thread()
+            for worker in workers:
+                worker.terminate()
+
+    # Sort the RPTs by cycle number, in the same format as run_RPT.py
+    df = pd.read_csv(RPT_filename).sort_values("Cycle number", ignore_index=True)
+    df.to_csv(RPT_filename)
+
+    with open(sim_filename + ".json") as f:
+        metadata = json.load(f)
+    write_metadata(RPT_filename, C_RPT=C_RPT, RPT_at_cycles=RPT_at_cycles, **metadata)
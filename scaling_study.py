@@ -0,0 +1,125 @@
+#
+# Fit the cost of building and solving the models against the system size
+#
+# Combines the system sizes from compare_mesh_sizes.py with the timings from
+# time_models.py, fits time = a * size^k for each model, solver, mode and phase, and
+# extrapolates the runtime of the configurations we plan to run.
+#
+
+import sys
+import numpy as np
+import pandas as pd
+from prettytable import PrettyTable
+
+# Change settings here
+tag = "_SEI_porosity"  # degradation tag of system_size*.csv and timing*.csv
+proposed = [
+    # Model, Nx, Nr, solver, mode, number of cycles (for the CCCV mode)
+    ("DFN+SR", 160, 40, "casadi", "CCCV", 1000),
+    ("SPMe+SR", 160, 40, "casadi", "CCCV", 1000),
+]
+
+
+def fit_power_law(size, time):
+    """Fits time = a * size^k in log scale. Returns a, k and the R^2 of the fit."""
+    log_size, log_time = np.log(size), np.log(time)
+    k, log_a = np.polyfit(log_size, log_time, 1)
+    residuals = log_time - (log_a + k * log_size)
+    R2 = 1 - np.sum(residuals**2) / np.sum((log_time - log_time.mean()) ** 2)
+    return np.exp(log_a), k, R2
+
+
+def fit_system_size(sizes):
+    """
+    Fits the system size of each model as a + b Nx + c Nr + d Nx Nr, which is exact for
+    the finite volume discretisation of these models (see plot_mesh_sizes.py).
+    """
+    coefficients = {}
+    for model, df in sizes.groupby("Model"):
+        A = np.column_stack([np.ones(len(df)), df.Nx, df.Nr, df.Nx * df.Nr])
+        coefficients[model] = np.linalg.lstsq(A, df["# total"], rcond=None)[0]
+    return coefficients
+
+
+def system_size(coefficients, model, Nx, Nr):
+    return np.dot(coefficients[model], [1, Nx, Nr, Nx * Nr])
+
+
+if __name__ == "__main__":
+    sizes = pd.read_csv("system_size" + tag + ".csv", index_col=0)
+    timings = pd.read_csv("timing" + tag + ".csv", index_col=0)
+    if "Number of cycles" not in timings:
+        sys.exit(
+            "timing{}.csv has no number of cycles, run time_models.py again".format(tag)
+        )
+    df = timings.merge(sizes, on=["Model", "Nx", "Nr"])
+
+    phases = {"build": "Build time [s]", "solve": "Solve time [s]"}
+    fits = []
+    groups = df.groupby(["Model", "Solver", "Mode", "Number of cycles"])
+    for (model, solver, mode, N_cycles_timed), group in groups:
+        if group["# total"].nunique() < 2:
+            continue
+        for phase, column in phases.items():
+            a, k, R2 = fit_power_law(group["# total"], group[column])
+            fits.append([model, solver, mode, N_cycles_timed, phase, a, k, R2])
+    fits = pd.DataFrame(
+        fits,
+        columns=[
+            "Model",
+            "Solver",
+            "Mode",
+            "Number of cycles",
+            "Phase",
+            "a [s]",
+            "k",
+            "R2",
+        ],
+    )
+    fits.to_csv("scaling" + tag + ".csv")
+
+    table = PrettyTable(["Model", "Solver", "Mode", "Phase", "k", "R2"])
+    for _, fit in fits.iterrows():
+        table.add_row(
+            [
+                fit.Model,
+                fit.Solver,
+                fit.Mode,
+                fit.Phase,
+                "{:.2f}".format(fit.k),
+                "{:.3f}".format(fit.R2),
+            ]
+        )
+    print("Cost exponents (time ~ size^k)")
+    print(table)
+
+    # Extrapolate the runtime of the proposed configurations
+    coefficients = fit_system_size(sizes)
+    table = PrettyTable(
+        ["Model", "Nx", "Nr", "Solver", "Mode", "Size", "Build [s]", "Solve [s]"]
+    )
+    for model, Nx, Nr, solver, mode, N_cycles in proposed:
+        size = system_size(coefficients, model, Nx, Nr)
+        times = []
+        for phase in phases:
+            fit = fits[
+                (fits.Model == model)
+                & (fits.Solver == solver)
+                & (fits.Mode == mode)
+                & (fits.Phase == phase)
+            ]
+            if len(fit) == 0:
+                times.append(np.nan)
+                continue
+            time = fit["a [s]"].iloc[0] * size ** fit.k.iloc[0]
+            # The solve time of the CCCV mode scales with the number of cycles, from
+            # the number timed in time_models.py
+            if phase == "solve" and mode == "CCCV":
+                time *= N_cycles / fit["Number of cycles"].iloc[0]
+            times.append(time)
+        table.add_row(
+            [model, Nx, Nr, solver, mode, "{:.0f}".format(size)]
+            + ["{:.3g}".format(time) for time in times]
+        )
+    print("Extrapolated runtime")
+    print(table)
@@ -0,0 +1,227 @@
+#
+# Solve one experiment step from many states at once
+#
+# The states (e.g. the first states of several cycles) are stacked into one
+# block-diagonal DAE: the right hand side and algebraic equations of the built model
+# are mapped over the members with CasADi, and the stacked system is integrated by a
+# single IDAS integrator. As in the "safe" mode of the CasADi solver, the system is
+# integrated in windows and the termination events are checked after each window,
+# but separately for each member. A member whose event is crossed is integrated
+# alone on a fine grid over the crossing interval to locate the event, and is then
+# removed from the stacked system, which carries on with the remaining members.
+#
+
+import numpy as np
+import casadi
+import pybamm
+
+
+class StackedIntegrators:
+    """
+    Builds and caches the integrators of the stacked system of a model, for a
+    number of members and an output grid.
+    """
+
+    def __init__(self, model, solver):
+        self.model = model
+        self.solver = solver
+        self.integrators = {}
+
+    def __call__(self, N, grid):
+        key = (N, np.round(grid, decimals=12).tobytes())
+        if key not in self.integrators:
+            self.integrators[key] = self.build(N, grid)
+        return self.integrators[key]
+
+    def build(self, N, grid):
+        model = self.model
+        n_x, n_z = model.len_rhs, model.len_alg
+        n_p = model.casadi_rhs.size1_in(2)
+
+        # Each member has its own inputs and time offset
+        tau = casadi.MX.sym("tau")
+        x = casadi.MX.sym("x", n_x * N)
+        z = casadi.MX.sym("z", n_z * N)
+        p = casadi.MX.sym("p", (n_p + 1) * N)
+        P = casadi.reshape(p, n_p + 1, N)
+        t = P[n_p, :] + tau
+        y = casadi.vertcat(casadi.reshape(x, n_x, N), casadi.reshape(z, n_z, N))
+        inputs = P[:n_p, :]
+
+        problem = {
+            "t": tau,
+            "x": x,
+            "p": p,
+            "ode": casadi.reshape(model.casadi_rhs.map(N)(t, y, inputs), -1, 1),
+        }
+        if n_z == 0:
+            method = "cvodes"
+        else:
+            method = "idas"
+            problem["z"] = z
+            problem["alg"] = casadi.reshape(
+                model.casadi_algebraic.map(N)(t, y, inputs), -1, 1
+            )
+        options = {
+            "show_eval_warnings": False,
+            **self.solver.extra_options_setup,
+            "reltol": self.solver.rtol,
+            "abstol": self.solver.atol,
+            "grid": grid,
+            "output_t0": True,
+        }
+        return casadi.integrator("F", method, problem, options)
+
+
+def initial_state(model, solver, state, inputs):
+    """Consistent initial state of the model starting from a (first) state."""
+    if state.all_models[-1] == model:
+        model.y0 = state.all_ys[-1][:, -1]
+    else:
+        _, initial_conditions = model.set_initial_conditions_from(
+            state, return_type="ics"
+        )
+        model.y0 = initial_conditions.evaluate(0, inputs=inputs)
+    if model.len_alg > 0:
+        return solver.calculate_consistent_state(model, 0, inputs)
+    return casadi.DM(model.y0)
+
+
+def solve_stacked(simulation, states, inputs=None, fine_points=100):
+    """
+    Solves the experiment of a simulation, which must have a single step (e.g. a
+    discharge until the cut-off voltage), from each of the states at once (see the
+    top of this file). Returns a list with the solution of each state, which ends at
+    its own termination event or at the end of the step.
+    """
+    experiment = simulation.experiment
+    if len(experiment.operating_conditions) != 1:
+        raise ValueError("The experiment must have a single step to be stacked")
+    simulation.build_for_experiment()
+    op_conds = experiment.operating_conditions[0]
+    model = simulation.op_conds_to_built_models[op_conds["string"]]
+    solver = simulation.solver
+
+    # Inputs of each member, as for the steps of Simulation.solve
+    members = []
+    for state in states:
+        t0 = state.t[-1]
+        all_inputs = {**(inputs or {}), **op_conds, "start time": t0}
+        member_inputs = {
+            name: all_inputs[name]
+            for name in sorted(param.name for param in model.input_parameters)
+        }
+        if model not in solver.models_set_up:
+            solver.set_up(model, member_inputs)
+            solver.models_set_up[model] = {
+                "initial conditions": model.concatenated_initial_conditions
+            }
+        p = casadi.vertcat(*member_inputs.values())
+        members.append(
+            {
+                "inputs": member_inputs,
+                "p": p,
+                "ts": [np.array([t0])],
+                "ys": [initial_state(model, solver, state, member_inputs).full()],
+            }
+        )
+
+    events = [e for e in model.events if e.event_type == pybamm.EventType.TERMINATION]
+    t_sym = casadi.MX.sym("t")
+    y_sym = casadi.MX.sym("y", model.len_rhs + model.len_alg)
+    p_sym = casadi.MX.sym("p", members[0]["p"].shape[0])
+    event_values = casadi.Function(
+        "events",
+        [t_sym, y_sym, p_sym],
+        [
+            casadi.vertcat(
+                *[e(t_sym, y_sym, p_sym) for e in model.terminate_events_eval]
+            )
+        ],
+    )
+    integrators = StackedIntegrators(model, solver)
+    n_x, n_z = model.len_rhs, model.len_alg
+
+    def integrate(group, grid):
+        """Integrates the members of a group over the grid, from their last state."""
+        N = len(group)
+        y0 = np.hstack([member["ys"][-1][:, -1:] for member in group])
+        p = casadi.vertcat(
+            *[casadi.vertcat(member["p"], member["ts"][-1][-1]) for member in group]
+        )
+        try:
+            sol = integrators(N, grid)(
+                x0=y0[:n_x].T.reshape(-1), z0=y0[n_x:].T.reshape(-1), p=p
+            )
+        except RuntimeError as error:
+            raise pybamm.SolverError(error.args[0])
+        x, z = sol["xf"].full(), sol["zf"].full()
+        return [
+            np.vstack([x[k * n_x : (k + 1) * n_x], z[k * n_z : (k + 1) * n_z]])
+            for k in range(N)
+        ]
+
+    def first_crossing(member, t, y):
+        """Index of the first point past an event and the values of the events."""
+        values = event_values.map(len(t))(t, y, casadi.repmat(member["p"], 1, len(t)))
+        values = values.full()
+        crossed = np.flatnonzero(np.any(values <= 0, axis=0))
+        return (crossed[0], values) if len(crossed) else (None, values)
+
+    timescale = model.timescale_eval
+    duration = op_conds["time"] / timescale
+    period = op_conds["period"] / timescale
+    window = max((getattr(solver, "dt_max", None) or 600) / timescale, period)
+    active = members
+    elapsed = 0
+    while active and elapsed < duration - 1e-12:
+        length = min(window, duration - elapsed)
+        grid = np.linspace(0, length, max(int(round(length / period)), 1) + 1)
+        still_active = []
+        for member, y in zip(active, integrate(active, grid)):
+            t = member["ts"][-1][-1] + grid
+            k, values = first_crossing(member, t, y)
+            if k is None:
+                member["ts"].append(t[1:])
+                member["ys"].append(y[:, 1:])
+                still_active.append(member)
+                continue
+
+            # Locate the event on a fine grid over the crossing interval
+            if k == 0:
+                raise pybamm.SolverError(
+                    "Events are non-positive at initial conditions"
+                )
+            if k > 1:
+                member["ts"].append(t[1:k])
+                member["ys"].append(y[:, 1:k])
+            fine = np.linspace(0, grid[k] - grid[k - 1], fine_points)
+            t_fine = t[k - 1] + fine
+            y_fine = integrate([member], fine)[0]
+            j, values = first_crossing(member, t_fine, y_fine)
+            event = np.argmin(values[:, j])
+            w = values[event, j - 1] / (values[event, j - 1] - values[event, j])
+            t_event = t_fine[j - 1] + w * (t_fine[j] - t_fine[j - 1])
+            y_event = y_fine[:, j - 1] + w * (y_fine[:, j] - y_fine[:, j - 1])
+            member["t_event"] = np.array([t_event])
+            member["y_event"] = y_event[:, np.newaxis]
+            member["ts"].append(member["t_event"])
+            member["ys"].append(member["y_event"])
+            member["termination"] = "event: {}".format(events[event].name)
+        active = still_active
+        elapsed += length
+
+    solutions = []
+    for member in members:
+        solution = pybamm.Solution(
+            np.concatenate(member["ts"]),
+            np.hstack(member["ys"]),
+            model,
+            member["inputs"],
+            t_event=member.get("t_event"),
+            y_event=member.get("y_event"),
+            termination=member.get("termination", "final time"),
+        )
+        solutions.append(solution)
+
+    return solutions
@@ -0,0 +1,210 @@
+#
+# Compressed storage of the first state of each cycle
+#
+# Consecutive states differ only slightly, so they are stored in groups of
+# key_interval cycles as a key frame followed by the deltas between consecutive
+# states, and each group is compressed with zlib. The encodings are
+#   - "lossless": the deltas are the XOR of the bits of consecutive states, which are
+#     mostly zeros as the sign, exponent and leading digits rarely change
+#   - "float32": the deltas are stored in single precision
+#   - "quantised": the deltas are stored as integer multiples of tolerance times the
+#     largest magnitude of each entry, so the error is at most half of that
+# The lossy deltas are taken with respect to the reconstructed previous state, so the
+# error does not build up along the group. Any state is recovered by decoding a
+# single group.
+#
+# Running this file compresses the states of saved simulations, e.g.
+#   python state_archive.py data/sim_*.pkl --encoding quantised --tolerance 1e-8
+#
+
+import zlib
+import numpy as np
+
+ENCODINGS = ["lossless", "float32", "quantised"]
+
+
+class StateArchive:
+    """
+    Read-only sequence of the first states of the cycles of a solution, which can
+    replace `solution.all_first_states`. Indexing returns a :class:`pybamm.Solution`
+    with the state, as the entries of `all_first_states`.
+
+    Parameters
+    ----------
+    states : list of :class:`pybamm.Solution`
+        The states to store, e.g. `solution.all_first_states`.
+    encoding : str, optional
+        One of "lossless" (default), "float32" or "quantised".
+    tolerance : float, optional
+        Relative error of the "quantised" encoding, with respect to the largest
+        magnitude of each entry over all the states. Default is 1e-8.
+    key_interval : int, optional
+        Number of states per key frame. Larger intervals compress better but decoding
+        a state takes longer. Default is 50.
+    """
+
+    def __init__(self, states, encoding="lossless", tolerance=1e-8, key_interval=50):
+        if encoding not in ENCODINGS:
+            raise ValueError(
+                "encoding must be one of {}, not '{}'".format(ENCODINGS, encoding)
+            )
+        self.encoding = encoding
+        self.tolerance = tolerance
+        self.key_interval = key_interval
+
+        self.t = np.array([state.t[0] for state in states])
+        self.models = [state.all_models[0] for state in states]
+        self.inputs = [state.all_inputs[0] for state in states]
+        y = np.array([np.array(state.y)[:, 0] for state in states])
+        self.size = y.shape[1]
+
+        if encoding == "quantised":
+            self.step = tolerance * np.maximum(np.max(np.abs(y), axis=0), 1e-300)
+        else:
+            self.step = None
+
+        self.groups = []
+        max_error = 0
+        for start in range(0, len(y), key_interval):
+            y_group = y[start : start + key_interval]
+            data, reconstructed = self.encode(y_group)
+            self.groups.append(zlib.compress(data))
+            max_error = max(max_error, np.max(np.abs(reconstructed - y_group)))
+        # Largest absolute error of the stored states, 0 for the lossless encoding
+        self.max_error = max_error
+
+        self._cache = (None, None)
+
+    def encode(self, y):
+        """Encodes a group of states. Returns the bytes and the decoded states."""
+        if self.encoding == "lossless":
+            bits = y.view(np.uint64)
+            deltas = np.vstack([bits[:1], bits[1:] ^ bits[:-1]])
+            return deltas.tobytes(), y
+
+        reconstructed = np.empty_like(y)
+        reconstructed[0] = y[0]
+        if self.encoding == "float32":
+            deltas = np.empty((len(y) - 1, self.size), dtype=np.float32)
+            for k in range(1, len(y)):
+                deltas[k - 1] = y[k] - reconstructed[k - 1]
+                reconstructed[k] = reconstructed[k - 1] + deltas[k - 1]
+        else:
+            # The quantised states only depend on the cumulative sum of the integer
+            # deltas, so they can be computed at once
+            counts = np.round((y - y[0]) / self.step).astype(np.int64)
+            deltas = np.diff(counts, axis=0)
+            reconstructed[1:] = y[0] + counts[1:] * self.step
+        return y[0].tobytes() + deltas.tobytes(), reconstructed
+
+    def decode(self, group):
+        """Returns the states of a group, keeping the last decoded group in memory."""
+        if self._cache[0] == group:
+            return self._cache[1]
+
+        data = zlib.decompress(self.groups[group])
+        N = min(self.key_interval, len(self) - group * self.key_interval)
+        if self.encoding == "lossless":
+            bits = np.frombuffer(data, dtype=np.uint64).reshape(N, self.size)
+            y = np.bitwise_xor.accumulate(bits, axis=0).view(np.float64)
+        else:
+            key = np.frombuffer(data[: 8 * self.size], dtype=np.float64)
+            y = np.empty((N, self.size))
+            y[0] = key
+            if self.encoding == "float32":
+                deltas = np.frombuffer(data[8 * self.size :], dtype=np.float32)
+                deltas = deltas.reshape(N - 1, self.size)
+                # Same order of operations as when encoding
+                for k in range(1, N):
+                    y[k] = y[k - 1] + deltas[k - 1]
+            else:
+                deltas = np.frombuffer(data[8 * self.size :], dtype=np.int64)
+                counts = np.cumsum(deltas.reshape(N - 1, self.size), axis=0)
+                y[1:] = key + counts * self.step
+
+        self._cache = (group, y)
+        return y
+
+    def __len__(self):
+        return len(self.t)
+
+    def __getitem__(self, index):
+        import pybamm
+
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("state index out of range")
+
+        group, k = divmod(index, self.key_interval)
+        y = self.decode(group)[k]
+        return pybamm.Solution(
+            self.t[index : index + 1],
+            y[:, np.newaxis].copy(),
+            self.models[index],
+            self.inputs[index],
+            termination="success",
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def copy(self):
+        # PyBaMM copies all_first_states when given a starting solution
+        return list(self)
+
+    def nbytes(self):
+        """Size of the compressed states in bytes."""
+        return sum(len(group) for group in self.groups)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_cache"] = (None, None)
+        return state
+
+
+def compress_states(solution, **kwargs):
+    """
+    Replaces the first states of a solution by a :class:`StateArchive`, unless they
+    are already compressed. The keyword arguments are passed to the archive.
+    """
+    if not isinstance(solution.all_first_states, StateArchive):
+        solution.all_first_states = StateArchive(solution.all_first_states, **kwargs)
+    return solution.all_first_states
+
+
+if __name__ == "__main__":
+    import os
+    import argparse
+    import pybamm
+
+    parser = argparse.ArgumentParser(
+        description="Compress the first states of saved simulations"
+    )
+    parser.add_argument("filenames", nargs="+")
+    parser.add_argument("--encoding", choices=ENCODINGS, default="lossless")
+    parser.add_argument("--tolerance", type=float, default=1e-8)
+    parser.add_argument("--key-interval", type=int, default=50)
+    args = parser.parse_args()
+
+    for filename in args.filenames:
+        size = os.path.getsize(filename)
+        sim = pybamm.load_sim(filename)
+        archive = compress_states(
+            sim.solution,
+            encoding=args.encoding,
+            tolerance=args.tolerance,
+            key_interval=args.key_interval,
+        )
+        sim.save(filename)
+        print(
+            "{}: {:.1f} MB -> {:.1f} MB, max error {:.2e}".format(
+                filename,
+                size / 1e6,
+                os.path.getsize(filename) / 1e6,
+                archive.max_error,
+            )
+        )
@@ -0,0 +1,361 @@
+#
+# Surrogate model of the capacity fade, trained on SPMe+SR simulations
+#
+# A Gaussian process maps the C-rates, the degradation options and the SEI and
+# plating rate constants to the RPT capacity at each RPT cycle. It is trained on a
+# space-filling design of SPMe+SR simulations and answers queries, with their
+# uncertainty, in milliseconds.
+#
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+import numpy as np
+from catalog import parse_value
+
+# Inputs of the surrogate with their bounds, and whether they vary on a log scale
+INPUTS = {
+    "C_dch": (0.5, 2, False),
+    "C_ch": (0.2, 1, False),
+    "SEI": (0, 1, False),
+    "plating": (0, 1, False),
+    "porosity": (0, 1, False),
+    "SEI kinetic rate constant [m.s-1]": (1e-13, 1e-11, True),
+    "Lithium plating kinetic rate constant [m.s-1]": (1e-12, 1e-10, True),
+}
+TAGS = ["SEI", "plating", "porosity"]
+PARAMETERS = [
+    "SEI kinetic rate constant [m.s-1]",
+    "Lithium plating kinetic rate constant [m.s-1]",
+]
+TRAINING_FILENAME = os.path.join("data", "surrogate_training.jsonl")
+MODEL_FILENAME = os.path.join("data", "surrogate.npz")
+
+
+def primes(N):
+    """Returns the first N prime numbers."""
+    found = []
+    candidate = 2
+    while len(found) < N:
+        if all(candidate % p for p in found if p * p <= candidate):
+            found.append(candidate)
+        candidate += 1
+    return found
+
+
+def halton_design(N, dim, seed=0):
+    """
+    Returns the first N points of a scrambled Halton sequence in [0, 1]^dim. Each
+    coordinate is the radical inverse of the point index in a prime base, with the
+    digits scrambled by random permutations (one per base and digit). The
+    permutations are fixed by the seed and do not depend on N, so the design of N
+    points contains that of any smaller N and can be extended without discarding
+    the points already run.
+    """
+    rng = np.random.default_rng(seed)
+    indices = np.arange(N)
+    X = np.zeros((N, dim))
+    for j, base in enumerate(primes(dim)):
+        # Enough digits to reach double precision
+        N_digits = int(np.ceil(53 * np.log(2) / np.log(base)))
+        remainder = indices.copy()
+        scale = 1 / base
+        for _ in range(N_digits):
+            permutation = rng.permutation(base)
+            X[:, j] += permutation[remainder % base] * scale
+            remainder //= base
+            scale /= base
+    return X
+
+
+def encode(points):
+    """Maps a list of points (dictionaries of inputs) to [0, 1]^dim."""
+    X = np.zeros((len(points), len(INPUTS)))
+    for j, (name, (low, high, log)) in enumerate(INPUTS.items()):
+        values = np.array([float(point[name]) for point in points])
+        if log:
+            values, low, high = np.log10(values), np.log10(low), np.log10(high)
+        X[:, j] = (values - low) / (high - low)
+    return X
+
+
+def decode(X):
+    """Inverse of :func:`encode`. The degradation options are rounded to booleans."""
+    points = [{} for _ in X]
+    for j, (name, (low, high, log)) in enumerate(INPUTS.items()):
+        if name in TAGS:
+            values = X[:, j] > 0.5
+        elif log:
+            values = 10 ** (np.log10(low) + X[:, j] * (np.log10(high) - np.log10(low)))
+        else:
+            values = low + X[:, j] * (high - low)
+        for point, value in zip(points, values):
+            point[name] = value.item()
+    return points
+
+
+def run_point(point, N_cycles, RPT_at_cycles, C_RPT=1 / 3):
+    """
+    Runs the SPMe+SR simulation of a design point and the RPTs at the same cycles as
+    run_RPT. Returns the cycle numbers and the RPT capacities.
+    """
+    import pybamm
+    from auxiliary_functions import (
+        cycling_experiment,
+        create_model_options,
+        set_parameters,
+        solve_cycles,
+        solve_RPT,
+        RPT_experiment,
+    )
+
+    options = create_model_options({tag: point[tag] for tag in TAGS})
+    model = pybamm.lithium_ion.SPMe(name="SPMe+SR", options=options)
+    param = set_parameters()
+    param.update({name: point[name] for name in PARAMETERS})
+
+    experiment = cycling_experiment(point["C_dch"], point["C_ch"])
+    sim = pybamm.Simulation(
+        model,
+        parameter_values=param,
+        experiment=experiment,
+        solver=pybamm.CasadiSolver("safe"),
+    )
+
+    states = {}
+
+    def keep_state(cycle, first_state):
+        if cycle == 0 or (cycle + 1) % RPT_at_cycles == 0:
+            states[cycle + 1] = first_state
+
+    solve_cycles(sim, N_cycles, save_at_cycles=[1], on_cycle_end=keep_state)
+
+    RPT = RPT_experiment(C_RPT)
+    capacities = [
+        solve_RPT(model, state, RPT, param, lean=True)[0] for state in states.values()
+    ]
+
+    return list(states), capacities
+
+
+def run_design(N, N_cycles, RPT_at_cycles, processes=None, seed=0):
+    """
+    Runs the simulations of a design of N points in parallel, appending each result
+    to the training file as soon as it is available. Points already in the file are
+    skipped, so the design can be extended by increasing N, and points that failed
+    are run again.
+    """
+    points = decode(halton_design(N, len(INPUTS), seed=seed))
+
+    done = []
+    if os.path.exists(TRAINING_FILENAME):
+        with open(TRAINING_FILENAME) as f:
+            records = [json.loads(line) for line in f]
+        done = [record["point"] for record in records if "error" not in record]
+    points = [point for point in points if point not in done]
+    print("Running {} design points".format(len(points)))
+
+    with multiprocessing.Pool(processes) as pool, open(TRAINING_FILENAME, "a") as f:
+        results = pool.imap_unordered(
+            run_design_point, [(point, N_cycles, RPT_at_cycles) for point in points]
+        )
+        for point, cycles, capacities, error in results:
+            record = {"point": point, "cycles": cycles, "capacity": capacities}
+            if error is not None:
+                record["error"] = error
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+
+
+def run_design_point(args):
+    point = args[0]
+    try:
+        cycles, capacities = run_point(*args)
+        error = None
+    except Exception as e:
+        print("Design point {} failed: {}".format(point, e))
+        cycles, capacities, error = [], [], str(e)
+    return point, cycles, capacities, error
+
+
+def load_training(N_cycles, RPT_at_cycles):
+    """
+    Returns the encoded inputs and the RPT capacities of the design points. Points
+    whose simulation failed or stopped before N_cycles are skipped.
+    """
+    cycles = [1] + list(range(RPT_at_cycles, N_cycles + 1, RPT_at_cycles))
+    points = []
+    capacities = []
+    with open(TRAINING_FILENAME) as f:
+        for line in f:
+            record = json.loads(line)
+            if record["cycles"] == cycles:
+                points.append(record["point"])
+                capacities.append(record["capacity"])
+    return encode(points), np.array(capacities), np.array(cycles)
+
+
+class GaussianProcess:
+    """
+    Gaussian process regression with a squared exponential kernel, with one length
+    scale per input. The columns of Y (e.g. the capacity at each cycle) are modelled
+    as independent outputs sharing the same kernel.
+    """
+
+    def __init__(self, length_scales=None, noise=None):
+        self.length_scales = length_scales
+        self.noise = noise
+
+    def kernel(self, X1, X2, length_scales=None):
+        if length_scales is None:
+            length_scales = self.length_scales
+        d = (X1[:, None, :] - X2[None, :, :]) / length_scales
+        return np.exp(-0.5 * np.sum(d**2, axis=-1))
+
+    def log_marginal_likelihood(self, length_scales, noise):
+        """Log marginal likelihood of the normalised outputs, summed over outputs."""
+        n, N_outputs = self.Y_normalised.shape
+        K = self.kernel(self.X, self.X, length_scales) + noise * np.eye(n)
+        try:
+            L = np.linalg.cholesky(K)
+        except np.linalg.LinAlgError:
+            return -np.inf
+        alpha = np.linalg.solve(L.T, np.linalg.solve(L, self.Y_normalised))
+        return (
+            -0.5 * np.sum(self.Y_normalised * alpha)
+            - N_outputs * np.sum(np.log(np.diag(L)))
+            - 0.5 * n * N_outputs * np.log(2 * np.pi)
+        )
+
+    def fit(self, X, Y, N_candidates=500, seed=0):
+        """
+        Fits the GP to the data. If the hyperparameters were not given, they are chosen
+        by maximising the log marginal likelihood over random candidates.
+        """
+        self.X = X
+        self.Y_mean = Y.mean(axis=0)
+        self.Y_std = Y.std(axis=0) + 1e-12
+        self.Y_normalised = (Y - self.Y_mean) / self.Y_std
+
+        if self.length_scales is None or self.noise is None:
+            rng = np.random.default_rng(seed)
+            candidates = zip(
+                10 ** rng.uniform(-1.5, 1, (N_candidates, X.shape[1])),
+                10 ** rng.uniform(-8, -1, N_candidates),
+            )
+            self.length_scales, self.noise = max(
+                candidates, key=lambda c: self.log_marginal_likelihood(*c)
+            )
+
+        K = self.kernel(X, X) + self.noise * np.eye(len(X))
+        self.L = np.linalg.cholesky(K)
+        self.alpha = np.linalg.solve(
+            self.L.T, np.linalg.solve(self.L, self.Y_normalised)
+        )
+
+        return self
+
+    def predict(self, X):
+        """Returns the mean and standard deviation of the prediction at X."""
+        k = self.kernel(X, self.X)
+        mean = k @ self.alpha
+        v = np.linalg.solve(self.L, k.T)
+        var = np.maximum(1 + self.noise - np.sum(v**2, axis=0), 0)
+        std = np.sqrt(var)[:, None] * self.Y_std
+        return mean * self.Y_std + self.Y_mean, std
+
+    def save(self, filename, **data):
+        np.savez(
+            filename,
+            X=self.X,
+            Y=self.Y_normalised * self.Y_std + self.Y_mean,
+            length_scales=self.length_scales,
+            noise=self.noise,
+            **data
+        )
+
+    @classmethod
+    def load(cls, filename):
+        """Loads a GP and the extra data saved with it."""
+        data = dict(np.load(filename))
+        gp = cls(data.pop("length_scales"), data.pop("noise").item())
+        return gp.fit(data.pop("X"), data.pop("Y")), data
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Surrogate of the capacity fade")
+    parser.add_argument("--N-cycles", type=int, default=1000)
+    parser.add_argument("--RPT-at-cycles", type=int, default=10)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    design_parser = subparsers.add_parser("design", help="run the training design")
+    design_parser.add_argument("N", type=int, help="number of design points")
+    design_parser.add_argument("--processes", type=int, default=None)
+
+    subparsers.add_parser("fit", help="fit the surrogate to the training data")
+
+    predict_parser = subparsers.add_parser("predict", help="query the surrogate")
+    predict_parser.add_argument(
+        "inputs",
+        nargs="*",
+        help="inputs of the form key=value, e.g. C_dch=1 C_ch=C2 SEI=true",
+    )
+    args = parser.parse_args()
+
+    if args.command == "design":
+        run_design(args.N, args.N_cycles, args.RPT_at_cycles, args.processes)
+
+    elif args.command == "fit":
+        X, Y, cycles = load_training(args.N_cycles, args.RPT_at_cycles)
+        print("Fitting the surrogate to {} simulations".format(len(X)))
+        gp = GaussianProcess().fit(X, Y)
+        gp.save(MODEL_FILENAME, cycles=cycles)
+        print("Length scales:")
+        for name, length_scale in zip(INPUTS, gp.length_scales):
+            print("  {}: {:.3g}".format(name, length_scale))
+
+        # Leave-one-out error with the fitted hyperparameters
+        errors = []
+        for i in range(len(X)):
+            mask = np.arange(len(X)) != i
+            loo = GaussianProcess(gp.length_scales, gp.noise).fit(X[mask], Y[mask])
+            errors.append(loo.predict(X[i : i + 1])[0][0] - Y[i])
+        print(
+            "Leave-one-out RMSE: {:.4f} A.h".format(np.sqrt(np.mean(np.square(errors))))
+        )
+
+    elif args.command == "predict":
+        if not os.path.exists(MODEL_FILENAME):
+            sys.exit("Run `python surrogate.py fit` first")
+        # Defaults: the baseline scenario of the article
+        point = {
+            "C_dch": 1,
+            "C_ch": 0.5,
+            "SEI": True,
+            "plating": True,
+            "porosity": True,
+            "SEI kinetic rate constant [m.s-1]": 1e-12,
+            "Lithium plating kinetic rate constant [m.s-1]": 1e-11,
+        }
+        for arg in args.inputs:
+            key, value = arg.split("=", 1)
+            if key not in point:
+                raise KeyError(
+                    "Unknown input '{}', the inputs are: {}".format(
+                        key, ", ".join(INPUTS)
+                    )
+                )
+            point[key] = parse_value(value)
+
+        gp, data = GaussianProcess.load(MODEL_FILENAME)
+        start = time.perf_counter()
+        mean, std = gp.predict(encode([point]))
+        elapsed = time.perf_counter() - start
+
+        print("Cycle number, Discharge capacity [A.h], Standard deviation [A.h]")
+        for cycle, Q, dQ in zip(data["cycles"], mean[0], std[0]):
+            print("{}, {:.4f}, {:.4f}".format(cycle, Q, dQ))
+        print("Prediction time: {:.2f} ms".format(1000 * elapsed))
@@ -4,9 +4,16 @@
 
 import pybamm
 import numpy as np
+import pandas as pd
 from datetime import datetime
 from prettytable import PrettyTable
-from auxiliary_functions import set_parameters
+from auxiliary_functions import (
+    set_parameters,
+    create_model_tag,
+    create_mesh,
+    cycling_experiment,
+    solve_cycles,
+)
 
 pybamm.set_logging_level("WARNING")
 
@@ -35,23 +42,16 @@ C_ch = 1 / 2
 C_dch = 1
 factors_x = [1, 2]
 factors_r = [1, 2]
+grading = "uniform"  # or "graded", see graded_mesh.py
 solver_types = ["casadi", "scikits"]
 modes = {
     "CC": C_dch,
-    "CCCV": pybamm.Experiment(
-        [
-            (
-                "Discharge at {}C until 2.5 V".format(C_dch),
-                "Charge at {}C until 4.2 V".format(C_ch),
-                "Hold at 4.2 V until C/20",
-            )
-        ]
-        * N_cycles,
-    ),
+    # One cycle, repeated N_cycles times by solve_cycles
+    "CCCV": cycling_experiment(C_dch, C_ch),
 }
 
 tables = []
-var = pybamm.standard_spatial_vars
+rows = []
 
 for solver_type in solver_types:
     for mode_name, mode_settings in modes.items():
@@ -70,13 +70,9 @@ for solver_type in solver_types:
                     )
 
                     # Define number of points in mesh
-                    var_pts = {
-                        var.x_n: 20 * factor_x,
-                        var.x_s: 20 * factor_x,
-                        var.x_p: 20 * factor_x,
-                        var.r_n: 20 * factor_r,
-                        var.r_p: 20 * factor_r,
-                    }
+                    mesh = create_mesh(
+                        model, 20 * factor_x, 20 * factor_r, grading=grading
+                    )
 
                     # Define operating mode
                     if solver_type == "casadi":
@@ -110,19 +106,43 @@ for solver_type in solver_types:
                         parameter_values=param,
                         experiment=experiment,
                         C_rate=C_rate,
-                        var_pts=var_pts,
                         solver=solver,
+                        **mesh,
                     )
 
+                    # Time the build (processing and discretisation of the model)
+                    timer = pybamm.Timer()
+                    if experiment is None:
+                        sim.build()
+                    else:
+                        sim.build_for_experiment()
+                    build_time = timer.time().value
+
                     time_sublist = []
                     for j in range(N_solve):
                         print(
                             f"{datetime.now()} - Solving case {j + 1} out of {N_solve}"
                         )
-                        sim.solve(t_eval, calc_esoh=False)
+                        if experiment is None:
+                            sim.solve(t_eval, calc_esoh=False)
+                        else:
+                            solve_cycles(sim, N_cycles, calc_esoh=False)
                         time_sublist.append(sim.solution.solve_time.value)
 
                     times.append(time_sublist)
+                    rows.append(
+                        [
+                            model.name,
+                            20 * factor_x,
+                            20 * factor_r,
+                            solver_type,
+                            mode_name,
+                            1 if experiment is None else N_cycles,
+                            build_time,
+                            np.mean(time_sublist),
+                            np.std(time_sublist),
+                        ]
+                    )
 
                 table.add_row(
                     [f"Nx = {20 * factor_x}, Nr = {20 * factor_r}"]
@@ -143,3 +163,23 @@ for table_info in tables:
     print()
     print(f"{table_info[1][0]} simulation with {table_info[1][1]} solvers")
     print(table_info[0])
+
+# Save the timings, to be combined with the system sizes in scaling_study.py
+df = pd.DataFrame(
+    rows,
+    columns=[
+        "Model",
+        "Nx",
+        "Nr",
+        "Solver",
+        "Mode",
+        "Number of cycles",
+        "Build time [s]",
+        "Solve time [s]",
+        "Solve time std [s]",
+    ],
+)
+_, tag = create_model_tag(models[0])
+if grading != "uniform":
+    tag += "_" + grading
+df.to_csv("timing" + tag + ".csv")